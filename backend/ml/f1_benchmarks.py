@@ -0,0 +1,464 @@
+import os
+import sys
+import json
+import time
+import logging
+import shutil
+import platform
+import argparse
+import tempfile
+import threading
+import subprocess
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# ⏱️ BENCHMARKS DE LOS CAMINOS CALIENTES
+# ==========================================
+# Mide sin red ni FastF1 (sobre fixtures guardadas en backend/benchmarks/fixtures):
+#   strategy   -> StrategySimulator.find_best_strategies (varias vueltas y MAX_STOPS)
+#   stint      -> coste por llamada de predict_stint_time
+#   telemetry  -> build_telemetry_payload / get_telemetry_data (fallo y acierto de caché)
+#   ingest     -> extract_session_laps, HistoricalIngestor.ingest_session por sesión y
+#                 process_season concurrente contra un cargador falso (comprueba el
+#                 token-bucket, los reintentos con espera exponencial y las sesiones inexistentes)
+#   training   -> build_training_set, BulkTrainer.train_driver por piloto y FlatModel.predict
+# y guarda los resultados en JSON para comparar entre commits:
+#   python f1_benchmarks.py --output base.json
+#   python f1_benchmarks.py --compare base.json
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(SCRIPT_DIR)
+BENCH_DIR = os.path.join(BACKEND_DIR, 'benchmarks')
+FIXTURES_DIR = os.path.join(BENCH_DIR, 'fixtures')
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+BENCH_LAPS = [44, 57, 78]
+BENCH_MAX_STOPS = [3, 4]
+BENCH_DRIVERS = 20
+BENCH_CIRCUITS = 4            # Sesiones sintéticas por piloto para el entrenamiento
+BENCH_TRAIN_DRIVERS = 3
+REGRESSION_THRESHOLD = 0.10   # --compare marca como regresión una mediana un 10% peor
+COMPOUND_DEG = {'SOFT': 0.09, 'MEDIUM': 0.06, 'HARD': 0.04}
+BENCH_INGEST_EVENTS = 4       # GPs del calendario falso (FP2, Sprint inexistente y carrera)
+BENCH_INGEST_RATE = 20.0      # Cargas/s del limitador en el bench (la ingesta real va mucho más lenta)
+BENCH_INGEST_LATENCY = 0.02   # "Red" simulada por carga (s)
+BENCH_INGEST_FAILURES = 1     # Fallos transitorios de cada sesión antes de cargar
+
+# --- FIXTURES ---
+def generate_fixtures(fixtures_dir=FIXTURES_DIR, seed=42):
+    """Vueltas de una carrera y telemetría de una vuelta, deterministas (mismo seed, mismos datos)."""
+    os.makedirs(fixtures_dir, exist_ok=True)
+    rs = np.random.RandomState(seed)
+    rows = []
+    for d in range(BENCH_DRIVERS):
+        driver = f"D{d:02d}"
+        stops = sorted(rs.choice(np.arange(12, 50), size=rs.randint(1, 3), replace=False))
+        stints = np.split(np.arange(1, 58), stops)
+        for s, laps in enumerate(stints, start=1):
+            compound = ['SOFT', 'MEDIUM', 'HARD'][(s + d) % 3]
+            for life, lap in enumerate(laps, start=1):
+                rows.append({'Driver': driver, 'LapNumber': float(lap), 'Stint': float(s),
+                             'LapTimeSec': 92.0 + 0.02 * d + COMPOUND_DEG[compound] * life - 0.03 * lap + rs.normal(0, 0.3),
+                             'TyreLife': float(life), 'Compound': compound, 'FreshTyre': life == 1 or s > 1,
+                             'IsAccurate': rs.rand() > 0.05, 'SpeedST': 300 + rs.normal(0, 4)})
+    pd.DataFrame(rows).to_parquet(os.path.join(fixtures_dir, 'laps.parquet'), index=False)
+
+    n = 750
+    t = np.linspace(0, 92.0, n)
+    speed = 200 + 100 * np.sin(t / 6.0) ** 2
+    pd.DataFrame({
+        'TimeSec': t, 'Speed': speed.round(), 'RPM': (8000 + 40 * speed).round(),
+        'nGear': np.clip((speed // 45) + 1, 1, 8), 'Throttle': np.clip(speed / 3, 0, 100).round(),
+        'Brake': np.diff(speed, prepend=speed[0]) < -1.5,
+    }).to_parquet(os.path.join(fixtures_dir, 'car_data.parquet'), index=False)
+    json.dump({'source': 'synthetic', 'seed': seed, 'event': 'Bench Grand Prix', 'year': 2024},
+              open(os.path.join(fixtures_dir, 'meta.json'), 'w'), indent=4)
+
+def record_fixtures(year, gp_name, fixtures_dir=FIXTURES_DIR):
+    """Graba las fixtures a partir de una carrera real (necesita FastF1 y red o su caché)."""
+    from f1_telemetry_helper import load_race_session
+    os.makedirs(fixtures_dir, exist_ok=True)
+    session = load_race_session(gp_name, year)
+    laps = session.laps
+    df = pd.DataFrame({'Driver': laps['Driver'], 'LapNumber': laps['LapNumber'], 'Stint': laps['Stint'],
+                       'LapTimeSec': laps['LapTime'].dt.total_seconds(), 'TyreLife': laps['TyreLife'],
+                       'Compound': laps['Compound'], 'FreshTyre': laps['FreshTyre'].astype(bool),
+                       'IsAccurate': laps['IsAccurate'].astype(bool), 'SpeedST': laps['SpeedST']})
+    df.to_parquet(os.path.join(fixtures_dir, 'laps.parquet'), index=False)
+    car = laps.pick_fastest().get_car_data()
+    pd.DataFrame({'TimeSec': car['Time'].dt.total_seconds(), 'Speed': car['Speed'], 'RPM': car['RPM'],
+                  'nGear': car['nGear'], 'Throttle': car['Throttle'], 'Brake': car['Brake'].astype(bool)}
+                 ).to_parquet(os.path.join(fixtures_dir, 'car_data.parquet'), index=False)
+    json.dump({'source': 'fastf1', 'event': session.event['EventName'], 'year': int(year)},
+              open(os.path.join(fixtures_dir, 'meta.json'), 'w'), indent=4)
+
+class FixtureLaps(pd.DataFrame):
+    """Lo mínimo de fastf1.core.Laps que usan los caminos medidos."""
+    _metadata = ['car_data']
+    @property
+    def _constructor(self): return FixtureLaps
+    def pick_driver(self, driver): return self[self['Driver'] == driver]
+    def pick_fastest(self): return FixtureLap(self, self.loc[self['LapTime'].idxmin()])
+
+class FixtureLap:
+    def __init__(self, laps, row):
+        self.laps, self.row = laps, row
+    def __getitem__(self, key): return self.row[key]
+    def get_car_data(self): return FixtureCarData(self.laps.car_data.copy())
+
+class FixtureCarData(pd.DataFrame):
+    @property
+    def _constructor(self): return FixtureCarData
+    def add_distance(self):
+        dt = np.diff(self['Time'].dt.total_seconds().to_numpy(), prepend=0.0)
+        return self.assign(Distance=np.cumsum(self['Speed'].to_numpy() / 3.6 * dt))
+
+class FixtureCircuitInfo:
+    def __init__(self, length):
+        self.corners = pd.DataFrame({'Number': np.arange(1, 16), 'Distance': np.linspace(200, length - 200, 15)})
+
+class FixtureSession:
+    """Sesión de carrera construida desde las fixtures (sin FastF1)."""
+    def __init__(self, fixtures_dir=FIXTURES_DIR):
+        meta = json.load(open(os.path.join(fixtures_dir, 'meta.json'), 'r'))
+        laps = pd.read_parquet(os.path.join(fixtures_dir, 'laps.parquet'))
+        laps['LapTime'] = pd.to_timedelta(laps['LapTimeSec'], unit='s')
+        self.laps = FixtureLaps(laps.drop(columns=['LapTimeSec']))
+        car = pd.read_parquet(os.path.join(fixtures_dir, 'car_data.parquet'))
+        car['Time'] = pd.to_timedelta(car['TimeSec'], unit='s')
+        self.laps.car_data = car.drop(columns=['TimeSec'])
+        self.event = {'EventName': meta['event']}
+        self.year = meta['year']
+        self.weather_data = pd.DataFrame({'TrackTemp': [34.0, 36.0], 'AirTemp': [24.0, 26.0]})
+        self.results = pd.DataFrame({'Abbreviation': sorted(laps['Driver'].unique())})
+        self.results['FullName'] = self.results['Abbreviation']
+        self.results['TeamName'] = 'Bench'
+    def get_circuit_info(self):
+        return FixtureCircuitInfo(float(self.laps.pick_fastest().get_car_data().add_distance()['Distance'].iloc[-1]))
+
+class FakeLoader:
+    """
+    Sustituto de fastf1.get_session / get_event_schedule para la ingesta concurrente:
+    sesiones con las vueltas de las fixtures, latencia fija, `failures` fallos
+    transitorios por sesión y sin Sprint. Registra intentos y cargas simultáneas.
+    """
+    def __init__(self, session, events=BENCH_INGEST_EVENTS, failures=BENCH_INGEST_FAILURES,
+                 latency=BENCH_INGEST_LATENCY):
+        self.session, self.events, self.failures, self.latency = session, events, failures, latency
+        self.lock = threading.Lock()
+        self.attempts = {}
+        self.active = self.max_active = 0
+
+    def get_schedule(self, year):
+        return pd.DataFrame({'EventName': [f"Bench {i} Grand Prix" for i in range(self.events)],
+                             'EventDate': pd.Timestamp('2024-03-01') + pd.to_timedelta(np.arange(self.events) * 14, unit='D')})
+
+    def get_session(self, year, event_name, identifier):
+        if identifier == 'Sprint': raise ValueError(f"{event_name} no tiene Sprint")
+        return FakeLoadSession(self, event_name, identifier)
+
+    def load(self, fake):
+        with self.lock:
+            attempt = self.attempts[fake.key] = self.attempts.get(fake.key, 0) + 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.latency)
+            if attempt <= self.failures: raise ConnectionError(f"Fallo simulado {attempt} en {fake.key}")
+        finally:
+            with self.lock: self.active -= 1
+
+class FakeLoadSession:
+    def __init__(self, loader, event_name, identifier):
+        self.loader, self.key = loader, (event_name, identifier)
+        self.api_path = f"/static/bench/{event_name}/{identifier}/"  # Nunca en caché: pasa por el limitador
+    def load(self, **kwargs):
+        self.loader.load(self)
+        src = self.loader.session
+        self.laps, self.weather_data, self.results = src.laps, src.weather_data, src.results
+
+class StubModel:
+    """Degradación lineal por compuesto: mismo coste de llamada que un modelo real barato."""
+    def predict(self, X):
+        X = np.asarray(X, dtype=float)
+        deg = np.array([COMPOUND_DEG['HARD'], COMPOUND_DEG['MEDIUM'], COMPOUND_DEG['SOFT']])[X[:, 2].astype(int)]
+        return 90.0 + deg * X[:, 0] - 0.03 * X[:, 1] + 0.05 * (X[:, 4] - 35.0)
+
+# --- MEDICIÓN ---
+def measure(fn, repeats=5, warmup=1):
+    for _ in range(warmup): fn()
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    times = np.array(times) * 1000
+    return {'repeats': repeats, 'min_ms': float(times.min()), 'median_ms': float(np.median(times)),
+            'mean_ms': float(times.mean())}
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=SCRIPT_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+class BenchmarkSuite:
+    def __init__(self, fixtures_dir=FIXTURES_DIR, repeats=5):
+        if not os.path.exists(os.path.join(fixtures_dir, 'meta.json')):
+            print(f"🧪 Generando fixtures sintéticas en {fixtures_dir}")
+            generate_fixtures(fixtures_dir)
+        self.fixtures_dir = fixtures_dir
+        self.repeats = repeats
+        self.session = FixtureSession(fixtures_dir)
+        self.results = []
+        self.workdir = tempfile.mkdtemp(prefix='racescope_bench_')
+
+    def record(self, name, params, stats, **extra):
+        entry = {'name': name, 'params': params, **stats, **extra}
+        self.results.append(entry)
+        label = ', '.join(f"{k}={v}" for k, v in params.items())
+        print(f"   {name:<22} {label:<28} {stats['median_ms']:>10.2f} ms")
+
+    def _simulator(self, laps):
+        import f1_strategy_predictor as predictor
+        from f1_race_context import default_context
+        from f1_flat_model import FlatEncoder
+        from f1_timing import StageTimer
+        # Simulador sin disco: contexto y modelo de las fixtures
+        sim = object.__new__(predictor.StrategySimulator)
+        sim.driver, sim.gp_name, sim.year = 'D00', self.session.event['EventName'], self.session.year
+        sim.ctx = {**default_context(sim.gp_name), 'total_laps': laps}
+        sim.lap_table = None
+        sim.timer = StageTimer()
+        sim._pkg = {'model': StubModel(), 'circuit_encoder': FlatEncoder([sim.gp_name]),
+                    'compound_encoder': FlatEncoder(['HARD', 'MEDIUM', 'SOFT'])}
+        return sim
+
+    def bench_strategy(self):
+        import f1_strategy_predictor as predictor
+        max_stops = predictor.MAX_STOPS
+        try:
+            for laps in BENCH_LAPS:
+                for stops in BENCH_MAX_STOPS:
+                    predictor.MAX_STOPS = stops
+                    sim = self._simulator(laps)
+                    self.record('strategy', {'laps': laps, 'max_stops': stops}, measure(sim.find_best_strategies, self.repeats))
+        finally:
+            predictor.MAX_STOPS = max_stops
+
+    def bench_stint(self):
+        sim = self._simulator(57)
+        calls = 200
+        stats = measure(lambda: [sim.predict_stint_time('MEDIUM', 10, 25) for _ in range(calls)], self.repeats)
+        self.record('predict_stint_time', {'calls': calls}, stats, per_call_us=stats['median_ms'] * 1000 / calls)
+
+    def bench_telemetry(self):
+        import f1_telemetry_helper as helper
+        from f1_telemetry_cache import TelemetryCache
+        driver = str(self.session.laps['Driver'].iloc[0])
+        for params in [{'step': 3}, {'points': 400}]:
+            stats = measure(lambda: helper.build_telemetry_payload(self.session, driver, **params), self.repeats)
+            size = len(json.dumps(helper.build_telemetry_payload(self.session, driver, **params)))
+            self.record('telemetry_payload', params, stats, json_bytes=size)
+
+        # get_telemetry_data completo: la sesión ya cargada y una caché de disco temporal
+        gp, year = self.session.event['EventName'], self.session.year
+        helper._SESSION_CACHE[(int(year), gp)] = self.session
+        previous = helper.RESPONSE_CACHE
+        try:
+            cache_dir = os.path.join(self.workdir, 'telemetry_cache')
+            def cold():
+                shutil.rmtree(cache_dir, ignore_errors=True)
+                helper.RESPONSE_CACHE = TelemetryCache(cache_dir)
+                return helper.get_telemetry_data(driver, gp, year)
+            self.record('get_telemetry_data', {'cache': 'miss'}, measure(cold, self.repeats))
+            self.record('get_telemetry_data', {'cache': 'hit'},
+                        measure(lambda: helper.get_telemetry_data(driver, gp, year), self.repeats))
+        finally:
+            helper.RESPONSE_CACHE = previous
+            helper._SESSION_CACHE.pop((int(year), gp), None)
+
+    def bench_ingest(self):
+        import f1_deg_pipeline as pipeline
+        from f1_lap_store import LapStore
+        gp, year = self.session.event['EventName'], self.session.year
+        stats = measure(lambda: pipeline.extract_session_laps(self.session, year, gp, 'R'), self.repeats)
+        self.record('extract_session_laps', {'laps': len(self.session.laps)}, stats)
+
+        store_dir = os.path.join(self.workdir, 'laps')
+        manifest = pipeline.IngestManifest()
+        manifest.sessions, manifest.path = {}, os.path.join(self.workdir, 'ingest_manifest.json')
+        def ingest():
+            shutil.rmtree(store_dir, ignore_errors=True)
+            ingestor = pipeline.HistoricalIngestor(pipeline.DriverRegistry(), store=LapStore(store_dir),
+                                                   manifest=manifest, get_session=lambda *a: None,
+                                                   get_schedule=lambda *a: pd.DataFrame())
+            return ingestor.ingest_session(self.session, year, gp, 'R')
+        self.record('ingest_session', {'laps': len(self.session.laps)}, measure(ingest, self.repeats))
+        self.bench_concurrent_ingest()
+
+    def bench_concurrent_ingest(self):
+        """process_season con el cargador falso: mide la temporada y comprueba límites y reintentos."""
+        import f1_deg_pipeline as pipeline
+        from f1_lap_store import LapStore
+        store_dir = os.path.join(self.workdir, 'season_laps')
+        runs = []
+        def season():
+            shutil.rmtree(store_dir, ignore_errors=True)
+            loader = FakeLoader(self.session)
+            manifest = pipeline.IngestManifest()
+            manifest.sessions, manifest.path = {}, os.path.join(self.workdir, 'season_manifest.json')
+            limiter = pipeline.TokenBucket(BENCH_INGEST_RATE, pipeline.INGEST_BURST)
+            grants, backoffs = [], []
+            acquire = limiter.acquire
+            def timed_acquire():
+                acquire()
+                grants.append(time.monotonic())
+            limiter.acquire = timed_acquire
+            # Las esperas de los reintentos se anotan pero no se duermen
+            ingestor = pipeline.HistoricalIngestor(pipeline.DriverRegistry(), store=LapStore(store_dir), manifest=manifest,
+                                                   get_session=loader.get_session, get_schedule=loader.get_schedule,
+                                                   limiter=limiter, sleep=backoffs.append)
+            changed = ingestor.process_season(self.session.year)
+            runs.append((loader, manifest, sorted(grants), backoffs, changed))
+        # Los reintentos simulados no deben llenar logs/pipeline.log
+        level = pipeline.logger.level
+        pipeline.logger.setLevel(logging.ERROR)
+        try:
+            self.record('process_season', {'events': BENCH_INGEST_EVENTS, 'rate': BENCH_INGEST_RATE},
+                        measure(season, self.repeats, warmup=0))
+        finally:
+            pipeline.logger.setLevel(level)
+        for run in runs: self._check_concurrent_ingest(*run)
+
+    def _check_concurrent_ingest(self, loader, manifest, grants, backoffs, changed):
+        import f1_deg_pipeline as pipeline
+        errors = []
+        loaded = [key for key in loader.attempts]
+        statuses = {k: e['status'] for k, e in manifest.sessions.items()}
+        if len(loaded) != 2 * loader.events: errors.append(f"{len(loaded)} sesiones cargadas de {2 * loader.events}")
+        if any(n != loader.failures + 1 for n in loader.attempts.values()):
+            errors.append(f"intentos por sesión {sorted(set(loader.attempts.values()))}, esperados {loader.failures + 1}")
+        expected = [pipeline.INGEST_BACKOFF_BASE * 2 ** k for k in range(loader.failures)] * len(loaded)
+        if sorted(backoffs) != sorted(expected): errors.append(f"esperas de reintento {sorted(set(backoffs))}")
+        if sum(s == 'ok' for s in statuses.values()) != len(loaded) or sum(s == 'absent' for s in statuses.values()) != loader.events:
+            errors.append(f"manifiesto {statuses}")
+        if not changed: errors.append("ningún piloto con vueltas nuevas")
+        # Token-bucket: en cualquier instante, como mucho la ráfaga más lo repuesto desde la primera carga
+        for i, t in enumerate(grants):
+            if i + 1 > pipeline.INGEST_BURST + BENCH_INGEST_RATE * (t - grants[0]) + 1e-6:
+                errors.append(f"carga {i + 1} a los {t - grants[0]:.3f}s supera el ritmo")
+                break
+        if loader.max_active > pipeline.INGEST_WORKERS: errors.append(f"{loader.max_active} cargas simultáneas")
+        if errors: raise RuntimeError("Ingesta concurrente: " + "; ".join(errors))
+
+    def bench_training(self):
+        import f1_deg_pipeline as pipeline
+        from f1_lap_store import LapStore
+        from f1_flat_model import FlatModel
+        from f1_training_set import build_training_set
+        year = self.session.year
+        store = LapStore(os.path.join(self.workdir, 'train_laps'))
+        # Varias "carreras" desplazando los tiempos para que haya más de un circuito por piloto
+        for c in range(BENCH_CIRCUITS):
+            df = pipeline.extract_session_laps(self.session, year, f"Bench {c} Grand Prix", 'R')
+            df['LapTimeSec'] += c * 3.0
+            store.upsert(df)
+        drivers = store.drivers()[:BENCH_TRAIN_DRIVERS]
+
+        models_dir = pipeline.DIRS['models']
+        pipeline.DIRS['models'] = os.path.join(self.workdir, 'models')
+        os.makedirs(pipeline.DIRS['models'], exist_ok=True)
+        try:
+            features_dir = os.path.join(self.workdir, 'features')
+            self.record('prepare_training_set', {'rows': len(store.read(columns=['Driver']))},
+                        measure(lambda: build_training_set(store), self.repeats))
+            trainer = pipeline.BulkTrainer(workers=1, store=store, features_dir=features_dir)
+            trainer.training_set()  # La preparación se mide aparte: aquí solo el ajuste y la exportación
+            # Entrenar es caro: una sola medición por piloto
+            times = []
+            for driver in drivers:
+                t0 = time.perf_counter()
+                if not trainer.train_driver(driver):
+                    raise RuntimeError(f"No se pudo entrenar {driver} (ver logs/pipeline.log)")
+                times.append((time.perf_counter() - t0) * 1000)
+            times = np.array(times)
+            self.record('train_driver', {'drivers': len(drivers), 'circuits': BENCH_CIRCUITS},
+                        {'repeats': len(times), 'min_ms': float(times.min()), 'median_ms': float(np.median(times)),
+                         'mean_ms': float(times.mean())})
+
+            model = FlatModel(os.path.join(pipeline.DIRS['models'], 'flat', drivers[0]))
+            X = self._simulator(57)._stint_features('MEDIUM', 1, 40)
+            X = np.repeat(X, 100, axis=0)
+            self.record('flat_model_predict', {'rows': len(X)}, measure(lambda: model.predict(X), self.repeats))
+        finally:
+            pipeline.DIRS['models'] = models_dir
+
+    def run(self, only=None):
+        benches = {'strategy': self.bench_strategy, 'stint': self.bench_stint, 'telemetry': self.bench_telemetry,
+                   'ingest': self.bench_ingest, 'training': self.bench_training}
+        try:
+            for name, fn in benches.items():
+                if only and name not in only: continue
+                print(f"⏱️  {name}")
+                fn()
+        finally:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+        import sklearn
+        fixtures_meta = json.load(open(os.path.join(self.fixtures_dir, 'meta.json'), 'r'))
+        return {'meta': {'timestamp': pd.Timestamp.now().isoformat(timespec='seconds'), 'commit': git_commit(),
+                         'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+                         'sklearn': sklearn.__version__, 'platform': platform.platform(),
+                         'cpus': os.cpu_count(), 'fixtures': fixtures_meta},
+                'results': self.results}
+
+def _result_key(entry):
+    return entry['name'], json.dumps(entry['params'], sort_keys=True)
+
+def compare_results(base, current, threshold=REGRESSION_THRESHOLD):
+    """Imprime la variación de la mediana respecto a `base`. Devuelve las regresiones."""
+    previous = {_result_key(e): e for e in base['results']}
+    regressions = []
+    print(f"\n📊 Comparación con {base['meta'].get('commit')} ({base['meta'].get('timestamp')})")
+    for entry in current['results']:
+        old = previous.get(_result_key(entry))
+        if old is None: continue
+        ratio = entry['median_ms'] / old['median_ms'] if old['median_ms'] > 0 else float('inf')
+        flag = '🔴' if ratio > 1 + threshold else ('🟢' if ratio < 1 - threshold else '  ')
+        print(f" {flag} {entry['name']:<22} {json.dumps(entry['params']):<32} "
+              f"{old['median_ms']:>10.2f} -> {entry['median_ms']:>10.2f} ms ({ratio:.2f}x)")
+        if ratio > 1 + threshold: regressions.append(entry)
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks offline de estrategia, telemetría, ingesta y entrenamiento")
+    parser.add_argument('--only', nargs='+', choices=['strategy', 'stint', 'telemetry', 'ingest', 'training'])
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--fixtures', default=FIXTURES_DIR)
+    parser.add_argument('--output', help="Fichero JSON de resultados (por defecto benchmarks/results/)")
+    parser.add_argument('--compare', help="JSON de una ejecución anterior con el que comparar")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument('--record', nargs=2, metavar=('YEAR', 'GP'), help="Grabar fixtures de una carrera real")
+    parser.add_argument('--regenerate', action='store_true', help="Regenerar las fixtures sintéticas")
+    args = parser.parse_args()
+
+    if args.record:
+        record_fixtures(int(args.record[0]), args.record[1], args.fixtures)
+        print(f"✅ Fixtures grabadas en {args.fixtures}")
+    elif args.regenerate:
+        generate_fixtures(args.fixtures)
+
+    base = json.load(open(args.compare, 'r')) if args.compare else None
+    results = BenchmarkSuite(args.fixtures, repeats=args.repeats).run(only=args.only)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = results['meta']['timestamp'].replace(':', '').replace('-', '')
+        output = os.path.join(RESULTS_DIR, f"bench_{results['meta']['commit'] or 'nogit'}_{stamp}.json")
+    with open(output, 'w') as f: json.dump(results, f, indent=4)
+    print(f"\n💾 Resultados en {output}")
+
+    if base is not None and compare_results(base, results, args.threshold):
+        sys.exit(1)
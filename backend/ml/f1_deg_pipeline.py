@@ -2,14 +2,25 @@ import fastf1
 import pandas as pd
 import numpy as np
 import os
+import sys
 import joblib
 import json
 import logging
 import time
+import hashlib
+import shutil
 from tqdm import tqdm
-from sklearn.ensemble import GradientBoostingRegressor
 from sklearn.preprocessing import LabelEncoder
 import warnings
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from f1_lap_store import LapStore
+from f1_files import atomic_write, slug
+from f1_flat_model import GLOBAL_PKG, export_flat_model
+from f1_training_set import FEATURES, GLOBAL_FEATURES, load_training_set
+from f1_model_backends import MODEL_BACKEND, BACKENDS, fit_model, is_flattenable, n_iterations, evaluate_backend
+from f1_timing import StageTimer, rotating_logger
 
 # ==========================================
 # ⚙️ CONFIGURACIÓN DE RUTAS (Backend Fix)
@@ -21,18 +32,16 @@ DIRS = {
     'models': os.path.join(BACKEND_DIR, 'models'),
     'logs': os.path.join(BACKEND_DIR, 'logs'),
     'data': os.path.join(BACKEND_DIR, 'data'),
-    'processed': os.path.join(BACKEND_DIR, 'data', 'processed')
+    'processed': os.path.join(BACKEND_DIR, 'data', 'processed'),  # CSV antiguos (solo migración)
+    'laps': os.path.join(BACKEND_DIR, 'data', 'laps'),
+    'features': os.path.join(BACKEND_DIR, 'data', 'features')  # Matriz de entrenamiento preparada
 }
 
 for key, path in DIRS.items():
     os.makedirs(path, exist_ok=True)
 
-# Configuración Logger
-logger = logging.getLogger('F1_Pipeline')
-logger.setLevel(logging.DEBUG)
-fh = logging.FileHandler(os.path.join(DIRS['logs'], 'pipeline.log'), mode='w', encoding='utf-8')
-fh.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-logger.addHandler(fh)
+# Configuración Logger (rotativo: cada ejecución se añade en vez de sobrescribir el log)
+logger = rotating_logger('F1_Pipeline', 'pipeline.log')
 
 # Configuración FastF1
 warnings.filterwarnings('ignore')
@@ -48,6 +57,45 @@ logging.getLogger('fastf1').setLevel(logging.ERROR)
 START_YEAR = 2025 
 END_YEAR = 2025
 
+# --- TABLAS DE TIEMPOS PRECALCULADAS ---
+# Además del modelo se exporta, por piloto y circuito, una tabla
+# compuesto x vuelta de carrera x vida del neumático que el predictor lee
+# con mmap en lugar de llamar a model.predict en cada petición.
+LAPTABLE_COMPOUNDS = ['SOFT', 'MEDIUM', 'HARD']
+LAPTABLE_MAX_LIFE_PCT = 0.75   # Vida máxima del HARD en el predictor (TYRE_LIMIT_PCT)
+LAPTABLE_TOP_SPEED = 300.0     # Velocidad punta por defecto del contexto de carrera
+# --- INGESTA INCREMENTAL ---
+# Las sesiones ingeridas menos de N días después del GP se vuelven a comprobar
+# en modo --incremental (FastF1 puede corregir tiempos tras la carrera).
+MANIFEST_SETTLE_DAYS = 3
+# Las sesiones sin vueltas ('absent': no existe, p.ej. Sprint en un fin de semana normal;
+# 'empty': sin vueltas válidas) también se anotan y se saltan una vez asentadas. Las que
+# fallan al cargar ('error') se reintentan hasta en N ejecuciones antes de saltarlas.
+MANIFEST_ERROR_RUNS = 3
+
+# --- CARGA CONCURRENTE DE SESIONES ---
+# Sustituye a las pausas fijas: hasta INGEST_WORKERS cargas en paralelo y, si
+# la sesión no está en la caché de FastF1, un token-bucket de INGEST_RATE
+# sesiones/s (ráfagas de INGEST_BURST). Los fallos se reintentan con espera exponencial.
+INGEST_WORKERS = 4
+INGEST_RATE = 0.25
+INGEST_BURST = 2
+INGEST_RETRIES = 3
+INGEST_BACKOFF_BASE = 5.0
+# Lo que pide session.load(laps=True, weather=True) a la API (el recuento de vueltas solo en carrera/sprint)
+CACHED_SESSION_FILES = ['session_info.ff1pkl', 'driver_info.ff1pkl', '_extended_timing_data.ff1pkl',
+                        'timing_app_data.ff1pkl', 'track_status_data.ff1pkl', 'session_status_data.ff1pkl',
+                        'weather_data.ff1pkl']
+CACHED_RACE_FILES = ['lap_count.ff1pkl']
+
+LAPTABLE_TEMP_DELTA = 5.0      # Rango (±ºC) usado para estimar la sensibilidad térmica
+
+# --- MODELO COMÚN (opcional) ---
+# Un solo ajuste con todas las vueltas y el piloto como categórica (HistGradientBoosting):
+# sirve también a debutantes sin vueltas suficientes para un modelo propio.
+GLOBAL_BACKEND = 'hgb'
+GLOBAL_CATEGORICAL = [GLOBAL_FEATURES.index(f) for f in ('Compound_Enc', 'Circuit_Enc', 'Driver_Enc')]
+
 # ==========================================
 # 📚 CLASES
 # ==========================================
@@ -74,25 +122,186 @@ class DriverRegistry:
         with open(self.registry_path, 'w', encoding='utf-8') as f:
             json.dump(self.drivers, f, indent=4)
 
+def laps_hash(df):
+    """Huella del contenido de un bloque de vueltas (independiente del índice)."""
+    values = pd.util.hash_pandas_object(df.reset_index(drop=True), index=False).values
+    return hashlib.sha1(values.tobytes()).hexdigest()[:16]
+
+class IngestManifest:
+    """Registro de sesiones ya ingeridas: (año, evento, sesión) -> huella por piloto."""
+    def __init__(self):
+        self.path = os.path.join(DIRS['data'], 'ingest_manifest.json')
+        self.sessions = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.sessions = json.load(f)
+            except: self.sessions = {}
+
+    @staticmethod
+    def key(year, event_name, identifier):
+        return f"{year}|{event_name}|{identifier}"
+
+    def needs_load(self, year, event_name, identifier, event_date):
+        entry = self.sessions.get(self.key(year, event_name, identifier))
+        if entry is None: return True
+        if entry.get('status') == 'error' and entry.get('attempts', 1) < MANIFEST_ERROR_RUNS: return True
+        try: settled = pd.Timestamp(entry['ingested_at']) >= pd.Timestamp(event_date) + pd.Timedelta(days=MANIFEST_SETTLE_DAYS)
+        except: settled = True
+        return not settled
+
+    def record(self, year, event_name, identifier, driver_hashes):
+        """Guarda las huellas de la sesión y devuelve los pilotos cuyos datos han cambiado."""
+        key = self.key(year, event_name, identifier)
+        previous = self.sessions.get(key, {}).get('drivers', {})
+        changed = {d for d, h in driver_hashes.items() if previous.get(d) != h}
+        self.sessions[key] = {
+            'status': 'ok',
+            'hash': hashlib.sha1(json.dumps(driver_hashes, sort_keys=True).encode()).hexdigest()[:16],
+            'drivers': driver_hashes,
+            'ingested_at': pd.Timestamp.now().isoformat(timespec='seconds'),
+        }
+        return changed
+
+    def record_missing(self, year, event_name, identifier, status, detail=None):
+        """Anota una sesión sin vueltas ('absent', 'empty' o 'error') para no recargarla en cada ejecución."""
+        key = self.key(year, event_name, identifier)
+        previous = self.sessions.get(key, {})
+        # Una sesión con datos buenos no se pisa por un fallo puntual de carga
+        if status == 'error' and previous.get('status', 'ok') == 'ok' and previous.get('drivers'): return
+        entry = {'status': status, 'ingested_at': pd.Timestamp.now().isoformat(timespec='seconds')}
+        if status == 'error':
+            entry['attempts'] = previous.get('attempts', 0) + 1 if previous.get('status') == 'error' else 1
+            entry['error'] = str(detail)[:200]
+        self.sessions[key] = entry
+
+    def save(self):
+        atomic_write(self.path, lambda f: json.dump(self.sessions, f, indent=4), mode='w')
+
+class SessionUnavailable(Exception):
+    """La sesión no existe en ese evento (no es un fallo de carga)."""
+
+class TokenBucket:
+    """Limitador de ritmo compartido entre hilos: `rate` cargas/s con ráfagas de hasta `capacity`."""
+    def __init__(self, rate, capacity, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+
+def retry_with_backoff(fn, retries=INGEST_RETRIES, base_delay=INGEST_BACKOFF_BASE, sleep=time.sleep, what=''):
+    """Reintenta fn con espera exponencial (base, 2*base, 4*base...). Relanza el último error."""
+    for attempt in range(retries + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == retries: raise
+            delay = base_delay * (2 ** attempt)
+            logger.warning(f"Reintentando {what} en {delay:.0f}s ({attempt+1}/{retries}): {e}")
+            sleep(delay)
+
+def is_session_cached(session, cache_dir=None):
+    """True si la caché de FastF1 ya tiene las vueltas de la sesión (la carga no toca la red)."""
+    cache_dir = cache_dir or DIRS['cache']
+    try: parts = session.api_path.strip('/').split('/')[1:]  # quitamos 'static'
+    except: return False
+    path = os.path.join(cache_dir, *parts)
+    files = CACHED_SESSION_FILES + (CACHED_RACE_FILES if getattr(session, 'name', None) in ('Race', 'Sprint') else [])
+    return all(os.path.exists(os.path.join(path, f)) for f in files)
+
+def extract_session_laps(session, year, event_name, identifier):
+    """Filtra y proyecta todas las vueltas válidas de la sesión en una sola pasada vectorizada."""
+    # Extracción segura de clima (una vez por sesión)
+    track, air = 35.0, 25.0
+    try:
+        w = getattr(session, 'weather_data', getattr(session, 'weather', None))
+        if w is not None and not w.empty:
+            track = w['TrackTemp'].mean()
+            air = w['AirTemp'].mean()
+    except: pass
+
+    laps = session.laps
+    # Filtros de calidad
+    laps = laps[(laps['IsAccurate'] == True) & ~laps['Compound'].isin(['UNKNOWN', 'TEST', 'MIXED'])]
+    if laps.empty: return pd.DataFrame()
+
+    df = pd.DataFrame({
+        'LapTimeSec': laps['LapTime'].dt.total_seconds(),
+        'RaceLapNumber': laps['LapNumber'],
+        'TyreLife': laps['TyreLife'],
+        'Compound': laps['Compound'],
+        'Stint': laps['Stint'],
+        'Driver': laps['Driver'],
+        'Year': year,
+        'Circuit': event_name,
+        'SessionType': identifier,
+        'TrackTemp': track,
+        'AirTemp': air,
+        'IsFreshTyre': laps['FreshTyre'].astype(bool).astype(int) if 'FreshTyre' in laps.columns else 1,
+        'TopSpeed': np.nan,
+    })
+    if 'SpeedST' in laps.columns:
+        # Huecos de velocidad punta -> media del propio piloto en la sesión
+        df['TopSpeed'] = laps['SpeedST'].fillna(laps.groupby('Driver')['SpeedST'].transform('mean'))
+    return df.reset_index(drop=True)
+
 class HistoricalIngestor:
-    def __init__(self, registry):
+    def __init__(self, registry, store=None, manifest=None, get_session=None, get_schedule=None,
+                 limiter=None, workers=INGEST_WORKERS, sleep=time.sleep, clock=time.monotonic):
         self.registry = registry
+        self.store = store if store is not None else LapStore(DIRS['laps'])
+        self.manifest = manifest if manifest is not None else IngestManifest()
+        # Inyectables para poder probar la ingesta sin FastF1 ni red (sleep y clock van
+        # juntos: con un sleep que no espera, el reloj tiene que avanzar por su cuenta)
+        self.get_session = get_session or fastf1.get_session
+        self.get_schedule = get_schedule or fastf1.get_event_schedule
+        self.limiter = limiter if limiter is not None else TokenBucket(INGEST_RATE, INGEST_BURST, clock=clock, sleep=sleep)
+        self.workers = max(1, int(workers))
+        self.sleep = sleep
 
     def get_schedule_safe(self, year):
         """Intento robusto de descargar calendario."""
-        for i in range(3):
-            try: 
-                return fastf1.get_event_schedule(year)
-            except Exception as e: 
-                logger.warning(f"Reintentando calendario {year} ({i+1}/3)...")
-                time.sleep(5)
-        return pd.DataFrame()
-
-    def process_season(self, year):
+        try:
+            return retry_with_backoff(lambda: self.get_schedule(year), sleep=self.sleep, what=f"calendario {year}")
+        except Exception:
+            return pd.DataFrame()
+
+    def load_session(self, year, event_name, identifier):
+        """Carga una sesión; solo consume del limitador si hay que ir a la red."""
+        timer = StageTimer()
+        # Sesión inexistente en el evento (Sprint en fin de semana normal, FP2 en uno sprint)
+        try: session = self.get_session(year, event_name, identifier)
+        except ValueError as e: raise SessionUnavailable(str(e)) from e
+        if not is_session_cached(session):
+            with timer.stage('rate_limit'): self.limiter.acquire()
+        with timer.stage('session_load'):
+            retry_with_backoff(lambda: session.load(laps=True, telemetry=False, weather=True, messages=False),
+                               sleep=self.sleep, what=f"{year} {event_name} {identifier}")
+        logger.debug(f"Sesión {year} {event_name} {identifier} cargada, tiempos (ms): {timer.as_dict()}")
+        return session
+
+    def process_season(self, year, incremental=False):
+        """Descarga la temporada. Devuelve los pilotos con vueltas nuevas o modificadas."""
+        changed_drivers = set()
         schedule = self.get_schedule_safe(year)
         if schedule.empty: 
             logger.error(f"No se pudo descargar calendario {year}")
-            return
+            return changed_drivers
 
         try: 
             # Filtrar solo eventos que ya han ocurrido
@@ -100,167 +309,351 @@ class HistoricalIngestor:
         except: 
             events = schedule
 
-        if events.empty: return
+        if events.empty: return changed_drivers
 
-        print(f"📥 Descargando Temporada {year} ({len(events)} carreras)...")
-        
-        # Iteramos por cada Gran Premio
-        pbar = tqdm(events.iterrows(), total=len(events), desc=f"  🗓️  Temp {year}", unit="GP", leave=False)
-        
-        for _, event in pbar:
-            pbar.set_postfix(GP=event['EventName'][:15])
-            
-            # --- PAUSA ANTI-BLOQUEO (CRÍTICO) ---
-            # Esperamos 5 segundos entre cada GP para no saturar la API
-            time.sleep(5) 
-
-            # Metadata (Solo intentamos una vez con carrera)
-            try:
-                r_session = fastf1.get_session(year, event['EventName'], 'R')
-                r_session.load(laps=False, telemetry=False, weather=False, messages=False)
-                if hasattr(r_session, 'results'):
-                    for _, row in r_session.results.iterrows():
-                        self.registry.update(row['Abbreviation'], row['FullName'], row['TeamName'], year)
-            except: pass
-
-            # Datos de Sesiones (FP2, Sprint, R)
+        # Trabajos (evento, sesión) a cargar: FP2, Sprint y Carrera
+        jobs = []
+        for _, event in events.iterrows():
             for identifier in ['FP2', 'Sprint', 'R']:
-                try:
-                    session = fastf1.get_session(year, event['EventName'], identifier)
-                    
-                    # Carga completa
-                    session.load(laps=True, telemetry=False, weather=True, messages=False)
-                    
-                    # Extracción segura de clima
-                    track, air = 35.0, 25.0
-                    try:
-                        w = getattr(session, 'weather_data', getattr(session, 'weather', None))
-                        if w is not None and not w.empty:
-                            track = w['TrackTemp'].mean()
-                            air = w['AirTemp'].mean()
-                    except: pass
-
-                    if not hasattr(session, 'laps'): continue
-
-                    # Procesar cada piloto
-                    for driver in session.laps['Driver'].unique():
-                        try:
-                            laps = session.laps.pick_driver(driver)
-                            # Filtros de calidad
-                            laps = laps[laps['IsAccurate'] == True]
-                            laps = laps[~laps['Compound'].isin(['UNKNOWN', 'TEST', 'MIXED'])]
-                            
-                            if laps.empty: continue
-
-                            # Crear DataFrame limpio
-                            df_save = pd.DataFrame({
-                                'LapTimeSec': laps['LapTime'].dt.total_seconds(),
-                                'RaceLapNumber': laps['LapNumber'],
-                                'TyreLife': laps['TyreLife'],
-                                'Compound': laps['Compound'],
-                                'Stint': laps['Stint'],
-                                'Driver': driver,
-                                'Year': year,
-                                'Circuit': event['EventName'], 
-                                'SessionType': identifier,
-                                'TrackTemp': track,
-                                'AirTemp': air,
-                                'IsFreshTyre': laps['FreshTyre'].astype(bool).astype(int) if 'FreshTyre' in laps.columns else 1,
-                                'TopSpeed': laps['SpeedST'].fillna(laps['SpeedST'].mean()) if 'SpeedST' in laps.columns else np.nan
-                            })
-
-                            # Guardar (Append mode)
-                            filename = os.path.join(DIRS['processed'], f"{driver}.csv")
-                            header = not os.path.exists(filename)
-                            df_save.to_csv(filename, mode='a', header=header, index=False)
-                        except: continue
-                except Exception as e: 
-                    logger.debug(f"Error sesión {identifier}: {e}")
+                if incremental and not self.manifest.needs_load(year, event['EventName'], identifier, event['EventDate']):
                     continue
+                jobs.append((event['EventName'], identifier))
+
+        if not jobs: return changed_drivers
+        print(f"📥 Descargando Temporada {year} ({len(events)} carreras, {len(jobs)} sesiones)...")
+        pbar = tqdm(total=len(jobs), desc=f"  🗓️  Temp {year}", unit="ses", leave=False)
+
+        # Las cargas van en paralelo; la extracción y escritura se hacen en este hilo
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(self.load_session, year, name, ident): (name, ident) for name, ident in jobs}
+            for fut in as_completed(futures):
+                event_name, identifier = futures[fut]
+                pbar.set_postfix(GP=event_name[:15])
+                pbar.update(1)
+                try:
+                    session = fut.result()
+                    changed_drivers |= self.ingest_session(session, year, event_name, identifier)
+                except SessionUnavailable as e:
+                    logger.debug(f"Sin sesión {year} {event_name} {identifier}: {e}")
+                    self.manifest.record_missing(year, event_name, identifier, 'absent')
+                    self.manifest.save()
+                except Exception as e:
+                    logger.warning(f"Error sesión {year} {event_name} {identifier}: {e}")
+                    self.manifest.record_missing(year, event_name, identifier, 'error', e)
+                    self.manifest.save()
+        pbar.close()
+        return changed_drivers
+
+    def ingest_session(self, session, year, event_name, identifier):
+        # Metadata de pilotos (los resultados vienen con la carga de la carrera)
+        if identifier == 'R':
+            try:
+                for _, row in session.results.iterrows():
+                    self.registry.update(row['Abbreviation'], row['FullName'], row['TeamName'], year)
+            except: pass
 
-class BulkTrainer:
-    def __init__(self):
-        self.circuit_encoder = LabelEncoder()
-        self.compound_encoder = LabelEncoder()
-
-    def train_all(self):
-        files = [f for f in os.listdir(DIRS['processed']) if f.endswith('.csv')]
-        if not files:
-            print(f"❌ No hay datos en {DIRS['processed']}")
-            return
+        df = extract_session_laps(session, year, event_name, identifier)
+        if df.empty:
+            self.manifest.record_missing(year, event_name, identifier, 'empty')
+            self.manifest.save()
+            return set()
 
-        print(f"🧠 Entrenando modelos para {len(files)} pilotos...")
-        pbar = tqdm(files, desc="Training", unit="driver", colour='green')
-        
-        for file in pbar:
-            driver_code = file.replace('.csv', '')
-            pbar.set_postfix(Driver=driver_code)
+        # Un único upsert por sesión; las huellas por piloto alimentan el manifiesto
+        self.store.upsert(df)
+        driver_hashes = {str(driver): laps_hash(grp) for driver, grp in df.groupby('Driver', sort=True)}
+        changed = self.manifest.record(year, event_name, identifier, driver_hashes)
+        self.manifest.save()
+        return changed
 
-            try:
-                df = pd.read_csv(os.path.join(DIRS['processed'], file))
-                df = df.dropna(subset=['LapTimeSec', 'TyreLife'])
-                if len(df) < 50: continue
-
-                # Extrapolación Hard
-                if 'HARD' not in df['Compound'].unique() and 'MEDIUM' in df['Compound'].unique():
-                    syn = df[df['Compound'] == 'MEDIUM'].copy()
-                    syn['Compound'] = 'HARD'
-                    syn['LapTimeSec'] += 0.8
-                    syn['TyreLife'] = syn['TyreLife'] * 0.8
-                    df = pd.concat([df, syn], ignore_index=True)
-
-                # Pesos
-                stint_meta = df.groupby(['Year', 'Circuit', 'SessionType', 'Stint'])['RaceLapNumber'].count().reset_index()
-                stint_meta.rename(columns={'RaceLapNumber': 'StintLength'}, inplace=True)
-                df = df.merge(stint_meta, on=['Year', 'Circuit', 'SessionType', 'Stint'], how='left')
-                df['SampleWeight'] = df['StintLength'].apply(lambda x: x if x > 3 else 0.5)
-
-                # Encoders
-                df['TopSpeed'] = df['TopSpeed'].fillna(df['TopSpeed'].mean())
-                df['Circuit'] = df['Circuit'].astype(str)
-                df['Compound'] = df['Compound'].astype(str)
-                
-                df['Circuit_Enc'] = self.circuit_encoder.fit_transform(df['Circuit'])
-                df['Compound_Enc'] = self.compound_encoder.fit_transform(df['Compound'])
-
-                features = ['TyreLife', 'RaceLapNumber', 'Compound_Enc', 'Circuit_Enc', 
-                            'TrackTemp', 'AirTemp', 'IsFreshTyre', 'TopSpeed']
-                
-                model = GradientBoostingRegressor(n_estimators=200, learning_rate=0.1, max_depth=4, random_state=42)
-                model.fit(df[features], df['LapTimeSec'], sample_weight=df['SampleWeight'])
-
-                pkg = {
-                    'model': model,
-                    'circuit_encoder': self.circuit_encoder,
-                    'compound_encoder': self.compound_encoder,
-                    'features': features,
-                    'driver': driver_code
-                }
-                joblib.dump(pkg, os.path.join(DIRS['models'], f'{driver_code}_pkg.pkl'))
-
-            except Exception as e:
-                logger.error(f"Error entrenando {driver_code}: {e}")
-                continue
+class BulkTrainer:
+    def __init__(self, workers=1, store=None, features_dir=None, rebuild_features=False, backend=MODEL_BACKEND):
+        self.workers = max(1, int(workers))
+        self.backend = backend
+        self.store = store if store is not None else LapStore(DIRS['laps'])
+        self.features_dir = features_dir or DIRS['features']
+        self.rebuild_features = rebuild_features
+        self._training_set = None
+
+    def __getstate__(self):
+        # A los procesos hijos no les pasamos los mmap: abren la caché ellos mismos
+        state = self.__dict__.copy()
+        state['_training_set'] = None
+        return state
+
+    def migrate_legacy_csv(self):
+        """Con el almacén Parquet vacío, importa los CSV antiguos de data/processed."""
+        if self.store.is_empty() and os.path.isdir(DIRS['processed']) and os.listdir(DIRS['processed']):
+            print(f"📦 Migrando CSV de {DIRS['processed']} al almacén Parquet...")
+            self.store.import_csv_dir(DIRS['processed'])
+
+    def training_set(self):
+        """Matriz preparada de todos los pilotos (se rehace solo si el almacén ha cambiado)."""
+        if self._training_set is None:
+            # Todos los modos (por piloto, común, comparación) ven los mismos datos
+            self.migrate_legacy_csv()
+            self._training_set = load_training_set(self.store, self.features_dir, rebuild=self.rebuild_features)
+            self.rebuild_features = False
+        return self._training_set
+
+    def _encode(self, encoder, value):
+        try: return encoder.transform([str(value)])[0]
+        except: return 0
+
+    def export_lap_tables(self, driver_code, df, model, circuit_encoder, compound_encoder):
+        """
+        Guarda en models/laptables/{piloto}/ una tabla por circuito:
+        {circuito}.npy -> (clima, compuesto, vuelta, vida): tiempo por vuelta en cada clima de carrera observado
+        {circuito}_sens.npy -> (2, compuesto, vida): s/ºC de TrackTemp y AirTemp
+        """
+        out_dir = os.path.join(DIRS['models'], 'laptables', driver_code)
+        os.makedirs(out_dir, exist_ok=True)
+        index = {'driver': driver_code, 'compounds': LAPTABLE_COMPOUNDS,
+                 'top_speed': LAPTABLE_TOP_SPEED, 'circuits': {}}
+        comp_codes = np.array([self._encode(compound_encoder, c) for c in LAPTABLE_COMPOUNDS])
+
+        for circuit, grp in df.groupby('Circuit'):
+            race = grp[grp['SessionType'] == 'R']
+            if race.empty: continue
+            laps = int(race['RaceLapNumber'].max())
+            max_life = int(laps * LAPTABLE_MAX_LIFE_PCT)
+            # Clima nominal: el medio de cada carrera disputada (el mismo que calcula el contexto)
+            weathers = race[['TrackTemp', 'AirTemp']].round(1).drop_duplicates().values.tolist()
+
+            c_idx, lap, life = np.meshgrid(np.arange(len(LAPTABLE_COMPOUNDS)), np.arange(1, laps + 1),
+                                           np.arange(1, max_life + 1), indexing='ij')
+            X = np.zeros((c_idx.size, 8))
+            X[:, 0] = life.ravel()
+            X[:, 1] = lap.ravel()
+            X[:, 2] = comp_codes[c_idx.ravel()]
+            X[:, 3] = self._encode(circuit_encoder, circuit)
+            X[:, 6] = 1
+            X[:, 7] = LAPTABLE_TOP_SPEED
+
+            def grid(track, air):
+                X[:, 4] = track
+                X[:, 5] = air
+                return model.predict(X).reshape(c_idx.shape)
+
+            table = np.stack([grid(track, air) for track, air in weathers]).astype(np.float32)
+
+            # Sensibilidad térmica: pendiente por mínimos cuadrados alrededor del clima
+            # medio, promediada sobre las vueltas de carrera (el GBR es escalonado)
+            track, air = float(race['TrackTemp'].mean()), float(race['AirTemp'].mean())
+            offsets = np.linspace(-LAPTABLE_TEMP_DELTA, LAPTABLE_TEMP_DELTA, 5)
+            sens = np.stack([
+                sum(o * grid(track + o, air) for o in offsets) / np.sum(offsets ** 2),
+                sum(o * grid(track, air + o) for o in offsets) / np.sum(offsets ** 2),
+            ]).mean(axis=2).astype(np.float32)
+
+            fname = slug(circuit)
+            atomic_write(os.path.join(out_dir, f"{fname}.npy"), lambda f: np.save(f, table))
+            atomic_write(os.path.join(out_dir, f"{fname}_sens.npy"), lambda f: np.save(f, sens))
+            index['circuits'][circuit] = {'file': f"{fname}.npy", 'sens_file': f"{fname}_sens.npy",
+                                          'laps': laps, 'max_life': max_life, 'weathers': weathers}
+
+        # El índice se escribe el último: solo apunta a tablas ya completas
+        atomic_write(os.path.join(out_dir, 'index.json'), lambda f: json.dump(index, f, indent=4), mode='w')
+
+    def train_driver(self, driver_code):
+        """Entrena un piloto de forma independiente (encoders propios). Devuelve True si guarda modelo."""
+        timer = StageTimer()
+        try:
+            # Vueltas ya preparadas (HARD sintético, pesos por stint, códigos): solo se lee su bloque
+            with timer.stage('read'): data = self.training_set().driver(driver_code)
+            if data is None: return False
+
+            circuit_encoder = LabelEncoder()
+            compound_encoder = LabelEncoder()
+            circuit_encoder.classes_ = np.array(data['circuit_classes'], dtype=object)
+            compound_encoder.classes_ = np.array(data['compound_classes'], dtype=object)
+            features = list(FEATURES)
+
+            with timer.stage('fit'): model = fit_model(self.backend, data['X'], data['y'], data['weight'])
+
+            pkg = {
+                'model': model,
+                'circuit_encoder': circuit_encoder,
+                'compound_encoder': compound_encoder,
+                'features': features,
+                'driver': driver_code,
+                'backend': self.backend
+            }
+            with timer.stage('export'):
+                atomic_write(os.path.join(DIRS['models'], f'{driver_code}_pkg.pkl'), lambda f: joblib.dump(pkg, f))
+                # Formato plano (mmap) que usa el predictor; el .pkl queda como respaldo.
+                # Los backends sin formato plano se sirven desde el .pkl: fuera el plano antiguo
+                flat_dir = os.path.join(DIRS['models'], 'flat', driver_code)
+                if is_flattenable(model): export_flat_model(pkg, flat_dir)
+                else: shutil.rmtree(flat_dir, ignore_errors=True)
+            with timer.stage('lap_tables'): self.export_lap_tables(driver_code, data['laps'], model, circuit_encoder, compound_encoder)
+            logger.info(f"{driver_code} entrenado ({self.backend}, {n_iterations(model)} iteraciones) con "
+                        f"{len(data['y'])} vueltas, tiempos (ms): {timer.as_dict()}")
+            return True
+
+        except Exception as e:
+            logger.error(f"Error entrenando {driver_code}: {e}")
+            return False
+
+    def train_global(self):
+        """Modelo común a todos los pilotos en models/global_pkg.pkl. Devuelve True si lo guarda."""
+        timer = StageTimer()
+        with timer.stage('read'): data = self.training_set().global_matrix()
+        if len(data['y']) == 0:
+            print(f"❌ No hay datos en {DIRS['laps']}")
+            return False
+
+        print(f"🌍 Entrenando modelo común ({GLOBAL_BACKEND}) con {len(data['y'])} vueltas de "
+              f"{len(data['driver_classes'])} pilotos...")
+        with timer.stage('fit'):
+            model = fit_model(GLOBAL_BACKEND, data['X'], data['y'], data['weight'], categorical=GLOBAL_CATEGORICAL)
+
+        encoders = {}
+        for name in ('circuit', 'compound', 'driver'):
+            encoders[name] = LabelEncoder()
+            encoders[name].classes_ = np.array(data[f'{name}_classes'], dtype=object)
+        pkg = {
+            'model': model,
+            'circuit_encoder': encoders['circuit'],
+            'compound_encoder': encoders['compound'],
+            'driver_encoder': encoders['driver'],
+            'features': list(GLOBAL_FEATURES),
+            'driver': None,
+            'backend': GLOBAL_BACKEND
+        }
+        with timer.stage('export'):
+            atomic_write(os.path.join(DIRS['models'], GLOBAL_PKG), lambda f: joblib.dump(pkg, f))
+        logger.info(f"Modelo común entrenado ({n_iterations(model)} iteraciones) con {len(data['y'])} vueltas, "
+                    f"tiempos (ms): {timer.as_dict()}")
+        return True
+
+    def compare_backends(self, drivers=None, backends=None):
+        """
+        Ajusta cada backend por piloto sin un 20% de sus vueltas y resume tiempo de ajuste,
+        latencia de predicción por 1k filas y error en ese holdout. No guarda modelos.
+        """
+        ts = self.training_set()
+        drivers = sorted(drivers) if drivers is not None else ts.drivers()
+        backends = backends or list(BACKENDS)
+        report = {}
+        for backend in backends:
+            rows = []
+            for driver_code in tqdm(drivers, desc=f"Backend {backend}", unit="driver", leave=False):
+                data = ts.driver(driver_code)
+                if data is None: continue
+                try: rows.append(evaluate_backend(backend, data['X'], data['y'], data['weight']))
+                except Exception as e: logger.error(f"Error evaluando {backend} en {driver_code}: {e}")
+            if not rows: continue
+            report[backend] = {k: float(np.mean([r[k] for r in rows if r[k] is not None] or [np.nan]))
+                               for k in rows[0]}
+            report[backend]['drivers'] = len(rows)
+
+        print(f"\n{'backend':<8} {'ajuste (ms)':>12} {'pred/1k (ms)':>13} {'MAE (s)':>9} {'RMSE (s)':>9} {'iter':>6}")
+        for backend, r in report.items():
+            print(f"{backend:<8} {r['fit_ms']:>12.1f} {r['predict_ms_per_1k']:>13.2f} {r['holdout_mae']:>9.3f} "
+                  f"{r['holdout_rmse']:>9.3f} {r['iterations']:>6.0f}")
+        atomic_write(os.path.join(DIRS['logs'], 'backend_comparison.json'),
+                     lambda f: json.dump({'ts': pd.Timestamp.now().isoformat(timespec='seconds'), 'drivers': drivers,
+                                          'backends': report}, f, indent=4), mode='w')
+        return report
+
+    def train_all(self, drivers=None):
+        # Preparación común una sola vez (o ninguna, si la caché sigue al día)
+        t0 = time.perf_counter()
+        ts = self.training_set()
+        if drivers is None:
+            drivers = self.store.drivers()
+        drivers = sorted(drivers)
+        if not drivers:
+            print(f"❌ No hay datos en {DIRS['laps']}")
+            return []
+
+        print(f"🧮 Conjunto de entrenamiento: {len(ts.y)} filas, {len(ts.drivers())} pilotos "
+              f"({(time.perf_counter() - t0) * 1000:.0f} ms)")
+
+        # Los pilotos sin vueltas suficientes no cuentan como fallo
+        trainable = set(ts.drivers())
+        skipped = [d for d in drivers if d not in trainable]
+        drivers = [d for d in drivers if d in trainable]
+
+        print(f"🧠 Entrenando modelos ({self.backend}) para {len(drivers)} pilotos ({self.workers} procesos)...")
+        pbar = tqdm(total=len(drivers), desc="Training", unit="driver", colour='green')
+        failed = []
+
+        if self.workers == 1:
+            for driver_code in drivers:
+                pbar.set_postfix(Driver=driver_code)
+                if not self.train_driver(driver_code): failed.append(driver_code)
+                pbar.update(1)
+        else:
+            # Cada piloto es independiente y escribe sus propios ficheros: el
+            # resultado es idéntico al secuencial sea cual sea el orden de llegada
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                futures = {pool.submit(self.train_driver, d): d for d in drivers}
+                for fut in as_completed(futures):
+                    driver_code = futures[fut]
+                    pbar.set_postfix(Driver=driver_code)
+                    pbar.update(1)
+                    # Errores del proceso hijo (BrokenProcessPool, pickling...) que train_driver no ve
+                    try: ok = fut.result()
+                    except Exception as e:
+                        logger.error(f"Error entrenando {driver_code}: {e!r}")
+                        ok = False
+                    if not ok: failed.append(driver_code)
+        pbar.close()
+
+        failed.sort()
+        print(f"✅ {len(drivers) - len(failed)} pilotos entrenados"
+              + (f", {len(skipped)} sin vueltas suficientes" if skipped else ""))
+        if failed: print(f"❌ Fallaron {len(failed)}: {', '.join(failed)} (ver logs/pipeline.log)")
+        return failed
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Descarga de vueltas y entrenamiento de modelos de degradación")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Procesos para entrenar pilotos en paralelo (1 = secuencial)")
+    parser.add_argument('--train-only', action='store_true', help="No descargar datos, solo re-entrenar")
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default=MODEL_BACKEND,
+                        help="Modelo de degradación a entrenar")
+    parser.add_argument('--global-model', action='store_true',
+                        help="Entrenar un único modelo común (piloto como categórica) en vez de uno por piloto")
+    parser.add_argument('--compare-backends', action='store_true',
+                        help="Solo comparar backends (ajuste, latencia y error en holdout), sin guardar modelos")
+    parser.add_argument('--rebuild-features', action='store_true',
+                        help="Rehacer la matriz de entrenamiento aunque el almacén no haya cambiado")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Cargar solo sesiones nuevas o sin asentar y re-entrenar solo los pilotos afectados")
+    args = parser.parse_args()
+
     print(f"\n🏎️  F1 PIPELINE | FORCE UPDATE: {START_YEAR}-{END_YEAR} 🏎️")
     print(f"📂 Backend: {BACKEND_DIR}")
     
-    registry = DriverRegistry()
-    ingestor = HistoricalIngestor(registry)
-    
-    print("📡 Iniciando descarga forzada (Modo Seguro)...")
-    
-    # Bucle de años con pausa larga entre temporadas
-    for year in range(START_YEAR, END_YEAR + 1):
-        ingestor.process_season(year)
-        print(f"⏸️  Pausa de seguridad de 10s entre temporadas...")
-        time.sleep(10) # Pausa larga entre años
+    changed_drivers = None  # None = re-entrenar todos
+    if not args.train_only:
+        registry = DriverRegistry()
+        ingestor = HistoricalIngestor(registry)
         
-    registry.save()
-
-    print("\n🧠 Re-entrenando modelos con los nuevos datos...")
-    trainer = BulkTrainer()
-    trainer.train_all()
+        print("📡 Iniciando descarga incremental..." if args.incremental else "📡 Iniciando descarga forzada (Modo Seguro)...")
+        
+        # El limitador del ingestor se comparte entre temporadas
+        changed = set()
+        for year in range(START_YEAR, END_YEAR + 1):
+            changed |= ingestor.process_season(year, incremental=args.incremental)
+
+        registry.save()
+        if args.incremental: changed_drivers = sorted(changed)
+
+    trainer = BulkTrainer(workers=args.workers, rebuild_features=args.rebuild_features, backend=args.backend)
+    if args.compare_backends:
+        trainer.compare_backends(drivers=changed_drivers)
+    elif args.global_model:
+        # Un solo ajuste: con datos nuevos de cualquier piloto se rehace entero
+        if changed_drivers == []: print("\n✅ Sin vueltas nuevas: no hace falta re-entrenar.")
+        else: trainer.train_global()
+    elif changed_drivers == []:
+        print("\n✅ Sin vueltas nuevas: no hace falta re-entrenar.")
+    else:
+        print("\n🧠 Re-entrenando modelos con los nuevos datos..." if changed_drivers is None
+              else f"\n🧠 Re-entrenando {len(changed_drivers)} pilotos con datos nuevos: {', '.join(changed_drivers)}")
+        if trainer.train_all(drivers=changed_drivers): sys.exit(1)
     
     print(f"\n✨ Proceso finalizado. Modelos actualizados en: {DIRS['models']}")
\ No newline at end of file
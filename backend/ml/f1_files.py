@@ -0,0 +1,25 @@
+import os
+
+# ==========================================
+# 📁 ESCRITURA DE FICHEROS COMPARTIDOS
+# ==========================================
+# Modelos, tablas, cachés y mapas los leen los workers mientras otro proceso
+# los reescribe: se escriben en un temporal y se renombran, así nunca queda
+# un fichero a medias (ni temporales sueltos si la escritura falla).
+
+def atomic_write(path, write_fn, mode='wb', opener=open, **kwargs):
+    """write_fn(f) escribe en un temporal que luego se renombra a `path`."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with opener(tmp, mode, **kwargs) as f:
+            write_fn(f)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp): os.remove(tmp)
+
+def slug(value):
+    """
+    Nombre apto para ficheros/directorios a partir de un GP, circuito, piloto, variante...
+    Sin separadores de ruta: un valor de la petición no puede salirse del directorio.
+    """
+    return str(value).replace(' ', '_').replace('/', '-').replace('\\', '-')
@@ -0,0 +1,211 @@
+import os
+import sys
+import glob
+import json
+import threading
+import numpy as np
+from collections import OrderedDict
+from f1_files import atomic_write
+
+# ==========================================
+# 🌳 MODELOS PLANOS (árboles como arrays NumPy)
+# ==========================================
+# models/flat/{piloto}/ guarda el GradientBoostingRegressor como arrays con
+# todos los nodos de todos los árboles seguidos: feature, threshold, value y
+# children (hijo izquierdo/derecho con índice global) + meta.json con la
+# constante inicial, el learning rate y las clases de los encoders.
+# Se cargan con mmap y se evalúan con NumPy: sin unpickle ni dependencia de
+# la versión de sklearn con la que se entrenó.
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(SCRIPT_DIR)
+MODELS_DIR = os.path.join(BACKEND_DIR, 'models')
+FLAT_DIR = os.path.join(MODELS_DIR, 'flat')
+
+FLAT_ARRAYS = ['feature', 'threshold', 'children', 'value']
+PREDICT_CHUNK = 256   # Filas por bloque al evaluar (el estado cabe en caché)
+MODEL_CACHE_SIZE = int(os.environ.get('RACESCOPE_MODEL_CACHE', 8))  # Pilotos en memoria por worker
+# Modelo común (models/global_pkg.pkl, piloto como categórica): 'driver' = el propio del
+# piloto si existe y si no el común; 'global' = siempre el común
+MODEL_SOURCE = os.environ.get('RACESCOPE_MODEL_SOURCE', 'driver').lower()
+GLOBAL_PKG = 'global_pkg.pkl'
+GLOBAL_KEY = '__global__'
+
+def flatten_gbr(model):
+    """Arrays planos de un GradientBoostingRegressor ya entrenado."""
+    trees = [est.tree_ for est in model.estimators_[:, 0]]
+    roots = np.cumsum([0] + [t.node_count for t in trees[:-1]])
+    feature, threshold, children, value = [], [], [], []
+    for root, t in zip(roots, trees):
+        ids = np.arange(t.node_count)
+        internal = t.children_left >= 0
+        feature.append(np.where(internal, t.feature, 0))
+        threshold.append(t.threshold)
+        # Las hojas apuntan a sí mismas: la evaluación se queda quieta en ellas
+        children.append(root + np.stack([np.where(internal, t.children_left, ids),
+                                         np.where(internal, t.children_right, ids)], axis=1))
+        value.append(t.value[:, 0, 0])
+    arrays = {
+        # Índices ya en intp: se usan tal cual desde el mmap, sin convertir al cargar
+        'feature': np.concatenate(feature).astype(np.intp),
+        'threshold': np.concatenate(threshold).astype(np.float64),
+        'children': np.concatenate(children).astype(np.intp),
+        'value': np.concatenate(value).astype(np.float64),
+    }
+    if model.init_ == 'zero': init = 0.0
+    else: init = float(np.ravel(model.init_.predict(np.zeros((1, model.n_features_in_))))[0])
+    meta = {'init': init, 'learning_rate': float(model.learning_rate), 'roots': roots.tolist(),
+            'depth': int(max(t.max_depth for t in trees)), 'n_features': int(model.n_features_in_)}
+    return arrays, meta
+
+def export_flat_model(pkg, out_dir):
+    """Guarda un paquete {'model', 'circuit_encoder', 'compound_encoder', ...} en formato plano."""
+    os.makedirs(out_dir, exist_ok=True)
+    arrays, meta = flatten_gbr(pkg['model'])
+    meta.update({'driver': pkg.get('driver'), 'features': list(pkg['features']),
+                 'circuit_classes': [str(c) for c in pkg['circuit_encoder'].classes_],
+                 'compound_classes': [str(c) for c in pkg['compound_encoder'].classes_]})
+    for name, arr in arrays.items():
+        atomic_write(os.path.join(out_dir, f"{name}.npy"), lambda f: np.save(f, arr))
+    # meta.json el último: solo apunta a arrays ya completos
+    atomic_write(os.path.join(out_dir, 'meta.json'), lambda f: json.dump(meta, f, indent=4), mode='w')
+
+class FlatEncoder:
+    """Sustituto de LabelEncoder.transform a partir de la lista de clases."""
+    def __init__(self, classes):
+        self.classes_ = np.array(classes)
+        self._index = {c: i for i, c in enumerate(classes)}
+
+    def transform(self, values):
+        try: return np.array([self._index[str(v)] for v in values])
+        except KeyError as e: raise ValueError(f"Etiqueta desconocida: {e}")
+
+class FlatModel:
+    def __init__(self, model_dir, mmap_mode='r'):
+        self.meta = json.load(open(os.path.join(model_dir, 'meta.json'), 'r'))
+        for name in FLAT_ARRAYS:
+            # Vista ndarray sobre el mmap (indexar un np.memmap es más lento)
+            setattr(self, name, np.asarray(np.load(os.path.join(model_dir, f"{name}.npy"), mmap_mode=mmap_mode)))
+        # Índices en intp en disco: siguen siendo vistas del mmap (ravel de un array
+        # contiguo no copia). Los exportados antes en int32 sí se copian al cargar
+        self.feature = self.feature.astype(np.intp, copy=False)
+        self.children = self.children.ravel().astype(np.intp, copy=False)
+        self.roots = np.array(self.meta['roots'], dtype=np.intp)
+        self.init = self.meta['init']
+        self.learning_rate = self.meta['learning_rate']
+        self.depth = self.meta['depth']
+
+    def predict(self, X):
+        # sklearn evalúa los árboles sobre float32: mismo redondeo para las mismas ramas
+        X = np.asarray(X, dtype=np.float32)
+        n, n_features = X.shape
+        flat_x = X.ravel()
+        out = np.empty(n)
+        for start in range(0, n, PREDICT_CHUNK):
+            stop = min(start + PREDICT_CHUNK, n)
+            row_offset = np.arange(start * n_features, stop * n_features, n_features)[:, None]
+            # Nodo actual de cada (fila, árbol); todos los árboles bajan un nivel a la vez
+            node = np.broadcast_to(self.roots, (stop - start, len(self.roots)))
+            for _ in range(self.depth):
+                go_right = flat_x[row_offset + self.feature[node]] > self.threshold[node]
+                node = self.children[2 * node + go_right]
+            out[start:stop] = self.value[node].sum(axis=1)
+        return self.init + self.learning_rate * out
+
+    def as_pkg(self):
+        """Misma forma que el .pkl de sklearn para que el predictor no distinga el formato."""
+        return {'model': self, 'features': self.meta['features'], 'driver': self.meta.get('driver'),
+                'circuit_encoder': FlatEncoder(self.meta['circuit_classes']),
+                'compound_encoder': FlatEncoder(self.meta['compound_classes'])}
+
+class GlobalDriverModel:
+    """Vista de un piloto sobre el modelo común: añade su código como última columna."""
+    def __init__(self, model, driver_code):
+        self.model = model
+        self.driver_code = driver_code  # NaN si el piloto no estaba en el entrenamiento
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        return self.model.predict(np.column_stack([X, np.full(len(X), self.driver_code)]))
+
+def driver_view(global_pkg, driver):
+    """Paquete con la forma de uno por piloto a partir del modelo común."""
+    classes = list(global_pkg['driver_encoder'].classes_)
+    code = classes.index(driver) if driver in classes else np.nan
+    return {**global_pkg, 'model': GlobalDriverModel(global_pkg['model'], code), 'driver': driver,
+            'features': global_pkg['features'][:-1]}
+
+class ModelRegistry:
+    """
+    Modelos por piloto compartidos por todo el proceso, con LRU de los más usados.
+    Usa el formato plano si existe y, si no, el .pkl antiguo. Sin modelo propio
+    (o con source='global') se usa el modelo común, cargado una sola vez.
+    """
+    def __init__(self, models_dir=MODELS_DIR, capacity=MODEL_CACHE_SIZE, source=MODEL_SOURCE):
+        self.models_dir = models_dir
+        self.capacity = max(1, int(capacity))
+        self.source = source
+        self._cache = OrderedDict()  # piloto -> (ruta, mtime, pkg)
+        self._lock = threading.Lock()
+
+    def flat_dir(self, driver):
+        return os.path.join(self.models_dir, 'flat', driver)
+
+    def pkl_path(self, driver):
+        return os.path.join(self.models_dir, f'{driver}_pkg.pkl')
+
+    def global_path(self):
+        return os.path.join(self.models_dir, GLOBAL_PKG)
+
+    def exists(self, driver):
+        return (os.path.exists(os.path.join(self.flat_dir(driver), 'meta.json')) or os.path.exists(self.pkl_path(driver))
+                or os.path.exists(self.global_path()))
+
+    def _source(self, driver):
+        if self.source == 'global' and os.path.exists(self.global_path()): return self.global_path()
+        meta = os.path.join(self.flat_dir(driver), 'meta.json')
+        if os.path.exists(meta): return meta
+        if os.path.exists(self.pkl_path(driver)): return self.pkl_path(driver)
+        if os.path.exists(self.global_path()): return self.global_path()
+        raise FileNotFoundError(f"No existe modelo para {driver}")
+
+    def is_global(self, driver):
+        """True si las peticiones de este piloto las sirve el modelo común."""
+        try: return self._source(driver) == self.global_path()
+        except FileNotFoundError: return False
+
+    def get(self, driver):
+        path = self._source(driver)
+        if path == self.global_path(): return driver_view(self._get_cached(GLOBAL_KEY, path), driver)
+        return self._get_cached(driver, path)
+
+    def _get_cached(self, key, path):
+        mtime = os.path.getmtime(path)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached and cached[0] == path and cached[1] == mtime:
+                self._cache.move_to_end(key)
+                return cached[2]
+
+        if path.endswith('meta.json'):
+            pkg = FlatModel(os.path.dirname(path)).as_pkg()
+        else:
+            import joblib
+            pkg = joblib.load(path)
+
+        with self._lock:
+            self._cache[key] = (path, mtime, pkg)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.capacity: self._cache.popitem(last=False)
+        return pkg
+
+if __name__ == "__main__":
+    # Conversión de los .pkl existentes: python f1_flat_model.py [PILOTO ...]
+    import joblib
+    drivers = sys.argv[1:] or sorted(os.path.basename(p)[:-len('_pkg.pkl')]
+                                     for p in glob.glob(os.path.join(MODELS_DIR, '*_pkg.pkl')))
+    for driver in drivers:
+        try:
+            export_flat_model(joblib.load(os.path.join(MODELS_DIR, f'{driver}_pkg.pkl')), os.path.join(FLAT_DIR, driver))
+            print(f"✅ {driver}")
+        except Exception as e:
+            print(f"❌ {driver}: {e}")
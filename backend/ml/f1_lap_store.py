@@ -0,0 +1,111 @@
+import os
+import glob
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from f1_files import atomic_write, slug
+
+# ==========================================
+# 🗄️ ALMACÉN DE VUELTAS (Parquet particionado)
+# ==========================================
+# data/laps/Year=2024/Circuit=Bahrain_Grand_Prix/SessionType=R/laps.parquet
+# Cada partición es una sesión completa. Las escrituras son upserts
+# idempotentes por KEY, así que re-procesar una temporada no duplica vueltas.
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(SCRIPT_DIR)
+LAPS_DIR = os.path.join(BACKEND_DIR, 'data', 'laps')
+
+KEY = ['Year', 'Circuit', 'SessionType', 'Driver', 'RaceLapNumber']
+
+SCHEMA = {
+    'LapTimeSec': 'float32',
+    'RaceLapNumber': 'int16',
+    'TyreLife': 'float32',
+    'Compound': 'category',
+    'Stint': 'float32',
+    'Driver': 'category',
+    'Year': 'int16',
+    'Circuit': 'category',
+    'SessionType': 'category',
+    'TrackTemp': 'float32',
+    'AirTemp': 'float32',
+    'IsFreshTyre': 'int8',
+    'TopSpeed': 'float32',
+}
+COLUMNS = list(SCHEMA)
+
+def normalize_laps(df):
+    """Columnas y tipos del almacén (las vueltas sin número no se pueden indexar)."""
+    df = df.dropna(subset=['RaceLapNumber'])
+    df = df[COLUMNS].copy()
+    for col, dtype in SCHEMA.items():
+        if dtype == 'category': df[col] = df[col].astype(str).astype('category')
+        else: df[col] = df[col].astype(dtype)
+    return df
+
+class LapStore:
+    def __init__(self, root=LAPS_DIR):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def partition_path(self, year, circuit, session_type):
+        return os.path.join(self.root, f"Year={int(year)}", f"Circuit={slug(circuit)}",
+                            f"SessionType={slug(session_type)}", 'laps.parquet')
+
+    def partitions(self, years=None, circuits=None, session_types=None):
+        """Ficheros de las particiones pedidas (poda por directorio, sin abrir nada)."""
+        years = None if years is None else {f"Year={int(y)}" for y in years}
+        circuits = None if circuits is None else {f"Circuit={slug(c)}" for c in circuits}
+        session_types = None if session_types is None else {f"SessionType={slug(s)}" for s in session_types}
+        files = []
+        for path in sorted(glob.glob(os.path.join(self.root, 'Year=*', 'Circuit=*', 'SessionType=*', 'laps.parquet'))):
+            y, c, s = path.split(os.sep)[-4:-1]
+            if years is not None and y not in years: continue
+            if circuits is not None and c not in circuits: continue
+            if session_types is not None and s not in session_types: continue
+            files.append(path)
+        return files
+
+    def is_empty(self):
+        return not self.partitions()
+
+    def _write(self, path, df):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        atomic_write(path, lambda f: pq.write_table(pa.Table.from_pandas(df, preserve_index=False), f))
+
+    def upsert(self, df):
+        """Inserta o reemplaza vueltas por KEY. Devuelve las particiones escritas."""
+        if df.empty: return []
+        df = normalize_laps(df)
+        written = []
+        for (year, circuit, session_type), part in df.groupby(['Year', 'Circuit', 'SessionType'], observed=True):
+            path = self.partition_path(year, circuit, session_type)
+            if os.path.exists(path):
+                part = pd.concat([pd.read_parquet(path), part], ignore_index=True)
+            part = part.drop_duplicates(subset=KEY, keep='last').sort_values(['Driver', 'RaceLapNumber'])
+            self._write(path, normalize_laps(part))
+            written.append(path)
+        return written
+
+    def read(self, columns=None, drivers=None, years=None, circuits=None, session_types=None):
+        """Lee solo las columnas y particiones necesarias."""
+        files = self.partitions(years, circuits, session_types)
+        if not files: return pd.DataFrame(columns=columns or COLUMNS)
+        dataset = ds.dataset(files, format='parquet')
+        flt = None if drivers is None else ds.field('Driver').isin([str(d) for d in drivers])
+        return dataset.to_table(columns=columns, filter=flt).to_pandas()
+
+    def drivers(self):
+        df = self.read(columns=['Driver'])
+        return sorted(df['Driver'].astype(str).unique())
+
+    def import_csv_dir(self, csv_dir):
+        """Migra los antiguos data/processed/{piloto}.csv (con sus duplicados) al almacén."""
+        files = sorted(glob.glob(os.path.join(csv_dir, '*.csv')))
+        if not files: return 0
+        df = pd.concat([pd.read_csv(path) for path in files], ignore_index=True)
+        if 'TopSpeed' not in df.columns: df['TopSpeed'] = np.nan
+        self.upsert(df)
+        return len(files)
@@ -0,0 +1,125 @@
+import os
+import time
+import numpy as np
+
+# ==========================================
+# 🧠 BACKENDS DE MODELO (degradación por piloto)
+# ==========================================
+# Todos reciben la matriz preparada (f1_training_set.FEATURES) y paran con un
+# conjunto de validación interno:
+#   gbr    -> GradientBoostingRegressor con n_iter_no_change (exportable a formato plano)
+#   hgb    -> HistGradientBoostingRegressor, Compound/Circuit como categóricas nativas
+#   linear -> regresión lineal L2 (la del README): base + degradación lineal y
+#             cuadrática por compuesto; alpha elegido en validación. Solo NumPy.
+# RACESCOPE_MODEL_BACKEND elige el de por defecto.
+MODEL_BACKEND = os.environ.get('RACESCOPE_MODEL_BACKEND', 'gbr')
+CATEGORICAL = [2, 3]        # Compound_Enc, Circuit_Enc
+VALIDATION_FRACTION = 0.1
+NO_CHANGE_ROUNDS = 10
+RANDOM_STATE = 42
+
+GBR_MAX_TREES = 200
+HGB_MAX_ITER = 500
+LINEAR_ALPHAS = [0.01, 0.1, 1.0, 10.0, 100.0]
+
+def fit_gbr(X, y, w, categorical=CATEGORICAL):
+    from sklearn.ensemble import GradientBoostingRegressor
+    model = GradientBoostingRegressor(n_estimators=GBR_MAX_TREES, learning_rate=0.1, max_depth=4,
+                                      validation_fraction=VALIDATION_FRACTION, n_iter_no_change=NO_CHANGE_ROUNDS,
+                                      random_state=RANDOM_STATE)
+    return model.fit(X, y, sample_weight=w)
+
+def fit_hgb(X, y, w, categorical=CATEGORICAL):
+    from sklearn.ensemble import HistGradientBoostingRegressor
+    model = HistGradientBoostingRegressor(max_iter=HGB_MAX_ITER, learning_rate=0.1, categorical_features=categorical,
+                                          early_stopping=True, validation_fraction=VALIDATION_FRACTION,
+                                          n_iter_no_change=NO_CHANGE_ROUNDS, random_state=RANDOM_STATE)
+    return model.fit(X, y, sample_weight=w)
+
+class LinearDegradationModel:
+    """
+    Ridge sobre: compuesto (one-hot) x [1, vida, vida²], circuito (one-hot) y el resto
+    de variables tal cual. Columnas estandarizadas; el intercepto no se penaliza.
+    """
+    def __init__(self, alpha=1.0):
+        self.alpha = alpha
+
+    def _design(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        life = X[:, 0:1]
+        comp = np.eye(self.n_compounds)[np.clip(X[:, 2].astype(int), 0, self.n_compounds - 1)]
+        circ = np.eye(self.n_circuits)[np.clip(X[:, 3].astype(int), 0, self.n_circuits - 1)]
+        return np.hstack([comp, comp * life, comp * life ** 2, circ, X[:, [1, 4, 5, 6, 7]]])
+
+    def fit(self, X, y, sample_weight=None):
+        X = np.asarray(X)
+        self.n_compounds = int(X[:, 2].max()) + 1
+        self.n_circuits = int(X[:, 3].max()) + 1
+        D = self._design(X)
+        y = np.asarray(y, dtype=np.float64)
+        w = np.ones(len(y)) if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)
+        w = w / w.sum()
+        self.mean_ = w @ D
+        self.scale_ = np.sqrt(w @ (D - self.mean_) ** 2)
+        self.scale_[self.scale_ == 0] = 1.0
+        Z = (D - self.mean_) / self.scale_
+        self.intercept_ = float(w @ y)
+        A = Z.T @ (Z * w[:, None]) + self.alpha / len(y) * np.eye(Z.shape[1])
+        self.coef_ = np.linalg.solve(A, Z.T @ (w * (y - self.intercept_)))
+        return self
+
+    def predict(self, X):
+        return self.intercept_ + ((self._design(X) - self.mean_) / self.scale_) @ self.coef_
+
+def _validation_split(n, seed=RANDOM_STATE):
+    idx = np.random.default_rng(seed).permutation(n)
+    n_val = max(1, int(n * VALIDATION_FRACTION))
+    return idx[n_val:], idx[:n_val]
+
+def fit_linear(X, y, w, categorical=CATEGORICAL):
+    X, y, w = np.asarray(X), np.asarray(y), np.asarray(w)
+    train, val = _validation_split(len(y))
+    errors = [np.average(np.abs(LinearDegradationModel(a).fit(X[train], y[train], w[train]).predict(X[val]) - y[val]),
+                         weights=w[val]) for a in LINEAR_ALPHAS]
+    # Con el alpha elegido, ajuste final con todas las vueltas
+    return LinearDegradationModel(LINEAR_ALPHAS[int(np.argmin(errors))]).fit(X, y, w)
+
+# `categorical` solo lo usa hgb (gbr y linear trabajan con los códigos de siempre)
+BACKENDS = {'gbr': fit_gbr, 'hgb': fit_hgb, 'linear': fit_linear}
+
+def fit_model(backend, X, y, w, categorical=CATEGORICAL):
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend desconocido: {backend} (opciones: {', '.join(BACKENDS)})")
+    return BACKENDS[backend](X, y, w, categorical=categorical)
+
+def is_flattenable(model):
+    """Solo el GradientBoostingRegressor se exporta a formato plano (f1_flat_model)."""
+    return type(model).__name__ == 'GradientBoostingRegressor'
+
+def n_iterations(model):
+    for attr in ('n_estimators_', 'n_iter_'):
+        if hasattr(model, attr): return int(getattr(model, attr))
+    return None
+
+def predict_latency_ms(model, X, rows=1000, repeats=5):
+    """Mediana de ms por cada `rows` filas."""
+    X = np.resize(np.asarray(X, dtype=np.float64), (rows, X.shape[1]))
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        model.predict(X)
+        times.append((time.perf_counter() - t0) * 1000)
+    return float(np.median(times))
+
+def evaluate_backend(backend, X, y, w, holdout_fraction=0.2, seed=RANDOM_STATE):
+    """Ajusta sin el holdout y devuelve tiempo de ajuste, latencia por 1k filas y error en el holdout."""
+    idx = np.random.default_rng(seed).permutation(len(y))
+    n_hold = max(1, int(len(y) * holdout_fraction))
+    hold, train = idx[:n_hold], idx[n_hold:]
+    t0 = time.perf_counter()
+    model = fit_model(backend, X[train], y[train], w[train])
+    fit_ms = (time.perf_counter() - t0) * 1000
+    err = model.predict(X[hold]) - y[hold]
+    return {'fit_ms': fit_ms, 'predict_ms_per_1k': predict_latency_ms(model, X),
+            'holdout_mae': float(np.mean(np.abs(err))), 'holdout_rmse': float(np.sqrt(np.mean(err ** 2))),
+            'iterations': n_iterations(model)}
@@ -0,0 +1,291 @@
+import os
+import sys
+import json
+import sqlite3
+import numpy as np
+import pandas as pd
+import argparse
+import warnings
+import logging
+import fastf1
+from f1_timing import MemoryMeter
+from f1_files import atomic_write, slug
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# ==========================================
+# 🏁 CONTEXTOS DE CARRERA (precálculo por temporada)
+# ==========================================
+# Vueltas, clima, pérdida en boxes y mapa de cada GP. Se generan por lotes con
+#   python f1_race_context.py 2024 --workers 4
+# y el predictor solo los lee de race_contexts.sqlite: ninguna petición de
+# usuario carga una sesión de FastF1.
+# La sesión se carga sin telemetría (solo vueltas y clima); para el mapa se
+# descargan únicamente las posiciones y nos quedamos con la vuelta rápida.
+# El mapa es una polilínea simplificada (Douglas-Peucker) en public/maps:
+# {año}_{gp}_Map.svg para el <img> del frontend y .json con los puntos.
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(SCRIPT_DIR)
+
+DIRS = {
+    'cache': os.path.join(BACKEND_DIR, 'f1_cache'),
+    'data': os.path.join(BACKEND_DIR, 'data'),
+    'maps': os.path.join(BACKEND_DIR, 'public', 'maps')
+}
+
+for d in DIRS.values(): os.makedirs(d, exist_ok=True)
+
+warnings.filterwarnings('ignore')
+try: fastf1.Cache.enable_cache(DIRS['cache'])
+except: pass
+logging.getLogger('fastf1').setLevel(logging.ERROR)
+
+CONTEXT_WORKERS = 2
+DEFAULT_PIT_LOSS = 22.5
+
+# --- MAPAS ---
+MAP_WIDTH = 600                # px del viewBox (el alto sale de la proporción del trazado)
+MAP_PADDING = 12
+MAP_TOLERANCE = 0.002          # Tolerancia de Douglas-Peucker, fracción de la diagonal del trazado
+MAP_BACKGROUND = '#1e1e1e'
+MAP_STROKE = '#ff3333'
+
+# --- DB TÉCNICA ---
+CIRCUIT_DB = {
+    'bahrain': {'deg': 'HIGH', 'downforce': 'MEDIUM', 'overtake': 'EASY'},
+    'saudi':   {'deg': 'MEDIUM', 'downforce': 'LOW', 'overtake': 'MEDIUM'},
+    'austral': {'deg': 'MEDIUM', 'downforce': 'HIGH', 'overtake': 'HARD'},
+    'azerba':  {'deg': 'LOW', 'downforce': 'LOW', 'overtake': 'EASY'},
+    'miami':   {'deg': 'MEDIUM', 'downforce': 'MEDIUM', 'overtake': 'MEDIUM'},
+    'monaco':  {'deg': 'LOW', 'downforce': 'MAXIMUM', 'overtake': 'IMPOSSIBLE'},
+    'spain':   {'deg': 'HIGH', 'downforce': 'HIGH', 'overtake': 'MEDIUM'},
+    'spani':   {'deg': 'HIGH', 'downforce': 'HIGH', 'overtake': 'MEDIUM'},
+    'canad':   {'deg': 'MEDIUM', 'downforce': 'LOW', 'overtake': 'EASY'},
+    'austri':  {'deg': 'HIGH', 'downforce': 'MEDIUM', 'overtake': 'EASY'},
+    'brit':    {'deg': 'HIGH', 'downforce': 'HIGH', 'overtake': 'HARD'},
+    'silver':  {'deg': 'HIGH', 'downforce': 'HIGH', 'overtake': 'HARD'},
+    'hungar':  {'deg': 'MEDIUM', 'downforce': 'MAXIMUM', 'overtake': 'HARD'},
+    'belgi':   {'deg': 'HIGH', 'downforce': 'LOW', 'overtake': 'EASY'},
+    'spa':     {'deg': 'HIGH', 'downforce': 'LOW', 'overtake': 'EASY'},
+    'dutch':   {'deg': 'HIGH', 'downforce': 'HIGH', 'overtake': 'HARD'},
+    'nether':  {'deg': 'HIGH', 'downforce': 'HIGH', 'overtake': 'HARD'},
+    'ital':    {'deg': 'LOW', 'downforce': 'MINIMUM', 'overtake': 'EASY'},
+    'monza':   {'deg': 'LOW', 'downforce': 'MINIMUM', 'overtake': 'EASY'},
+    'singap':  {'deg': 'HIGH', 'downforce': 'MAXIMUM', 'overtake': 'HARD'},
+    'japan':   {'deg': 'HIGH', 'downforce': 'HIGH', 'overtake': 'MEDIUM'},
+    'suzuka':  {'deg': 'HIGH', 'downforce': 'HIGH', 'overtake': 'MEDIUM'},
+    'qatar':   {'deg': 'HIGH', 'downforce': 'HIGH', 'overtake': 'MEDIUM'},
+    'austin':  {'deg': 'MEDIUM', 'downforce': 'HIGH', 'overtake': 'EASY'},
+    'united':  {'deg': 'MEDIUM', 'downforce': 'HIGH', 'overtake': 'EASY'},
+    'mexic':   {'deg': 'MEDIUM', 'downforce': 'MAXIMUM', 'overtake': 'MEDIUM'},
+    'brazil':  {'deg': 'MEDIUM', 'downforce': 'MEDIUM', 'overtake': 'EASY'},
+    'paulo':   {'deg': 'MEDIUM', 'downforce': 'MEDIUM', 'overtake': 'EASY'},
+    'vegas':   {'deg': 'LOW', 'downforce': 'LOW', 'overtake': 'EASY'},
+    'dhabi':   {'deg': 'MEDIUM', 'downforce': 'MEDIUM', 'overtake': 'HARD'}
+}
+
+class RaceContextManager:
+    """
+    Contextos en SQLite (modo WAL): lecturas por clave sin parsear todo el
+    almacén y escrituras atómicas aunque haya varios procesos a la vez.
+    El antiguo race_contexts.json se importa la primera vez.
+    """
+    def __init__(self, path=None, legacy_path=None):
+        self.path = path or os.path.join(DIRS['data'], 'race_contexts.sqlite')
+        self.legacy_path = legacy_path or os.path.join(DIRS['data'], 'race_contexts.json')
+        self.conn = sqlite3.connect(self.path, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS contexts (key TEXT PRIMARY KEY, data TEXT NOT NULL)')
+        self._import_legacy()
+    def _import_legacy(self):
+        if not os.path.exists(self.legacy_path): return
+        if self.conn.execute('SELECT 1 FROM contexts LIMIT 1').fetchone(): return
+        try: legacy = json.load(open(self.legacy_path, 'r'))
+        except: return
+        # INSERT OR IGNORE: si otro proceso importa a la vez no se pisan
+        with self.conn:
+            self.conn.executemany('INSERT OR IGNORE INTO contexts (key, data) VALUES (?, ?)',
+                                  [(k, json.dumps(v)) for k, v in legacy.items()])
+    def save_context(self, gp_name, year, data):
+        key = f"{year}_{gp_name}"
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO contexts (key, data) VALUES (?, ?)', (key, json.dumps(data)))
+    def get_context(self, gp_name, year):
+        key = f"{year}_{gp_name}"
+        row = self.conn.execute('SELECT data FROM contexts WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+def get_enrichment_data(gp_name):
+    name_lower = gp_name.lower()
+    for key, val in CIRCUIT_DB.items():
+        if key in name_lower: return val
+    return {'deg': 'UNKNOWN', 'downforce': 'UNKNOWN', 'overtake': 'UNKNOWN'}
+
+def default_context(gp_name):
+    return {'total_laps': 57, 'track_temp': 35.0, 'air_temp': 25.0,
+            'pit_loss': DEFAULT_PIT_LOSS, 'circuit_name': gp_name, 'avg_top_speed': 300.0,
+            'map_url': None, 'map_data': None, 'tech_info': get_enrichment_data(gp_name)}
+
+def fastest_lap_positions(session):
+    """
+    X/Y de la vuelta rápida sin cargar la telemetría de la sesión: solo el flujo de
+    posiciones (no car_data) y solo el piloto de esa vuelta, recortado a su ventana.
+    """
+    from fastf1 import api
+    lap = session.laps.pick_fastest()
+    pos = api.position_data(session.api_path).get(str(lap['DriverNumber']))
+    if pos is None: raise ValueError(f"Sin datos de posición para {lap['Driver']}")
+    # 'Time' del flujo es tiempo de sesión (aprox.): basta para dibujar el trazado
+    window = pos[(pos['Time'] >= lap['LapStartTime']) & (pos['Time'] <= lap['Time'])]
+    window = window[(window['X'] != 0) | (window['Y'] != 0)]  # Huecos rellenados con 0
+    if len(window) < 10: raise ValueError("Vuelta rápida sin suficientes datos de posición")
+    return window['X'].to_numpy(), window['Y'].to_numpy()
+
+def douglas_peucker(points, tolerance):
+    """Simplifica una polilínea (N, 2) manteniendo los puntos a más de `tolerance` de la cuerda."""
+    n = len(points)
+    if n < 3: return points
+    keep = np.zeros(n, dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2: continue
+        chord = points[end] - points[start]
+        rel = points[start + 1:end] - points[start]
+        length = np.hypot(*chord)
+        # Distancia a la recta (o al punto, si la cuerda es nula: trazado cerrado)
+        if length == 0: dist = np.hypot(rel[:, 0], rel[:, 1])
+        else: dist = np.abs(chord[0] * rel[:, 1] - chord[1] * rel[:, 0]) / length
+        i = int(np.argmax(dist))
+        if dist[i] > tolerance:
+            keep[start + 1 + i] = True
+            stack += [(start, start + 1 + i), (start + 1 + i, end)]
+    return points[keep]
+
+def track_polyline(x, y):
+    """Puntos simplificados y escalados al viewBox (Y hacia abajo). Devuelve (puntos, ancho, alto)."""
+    points = np.column_stack([x, y]).astype(float)
+    lo, hi = points.min(axis=0), points.max(axis=0)
+    span = np.maximum(hi - lo, 1e-9)
+    points = douglas_peucker(points, MAP_TOLERANCE * np.hypot(*span))
+    scale = (MAP_WIDTH - 2 * MAP_PADDING) / span[0]
+    height = int(np.ceil(span[1] * scale)) + 2 * MAP_PADDING
+    px = MAP_PADDING + (points[:, 0] - lo[0]) * scale
+    py = height - MAP_PADDING - (points[:, 1] - lo[1]) * scale
+    return np.round(np.column_stack([px, py]), 1), MAP_WIDTH, height
+
+def map_stem(gp_name, year):
+    """Nombre base de los ficheros del mapa en public/maps (sin extensión)."""
+    return f"{int(year)}_{slug(gp_name)}_Map"
+
+def write_track_map(x, y, gp_name, year):
+    """Guarda el SVG y el JSON del trazado. Devuelve (url_svg, url_json)."""
+    stem = map_stem(gp_name, year)
+    points, width, height = track_polyline(x, y)
+    coords = ' '.join(f"{px:g},{py:g}" for px, py in points)
+    svg = (f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {width} {height}" width="{width}" height="{height}">'
+           f'<rect width="100%" height="100%" fill="{MAP_BACKGROUND}"/>'
+           f'<polyline points="{coords}" fill="none" stroke="{MAP_STROKE}" stroke-width="3" '
+           f'stroke-linejoin="round" stroke-linecap="round"/></svg>')
+    data = {'gp': gp_name, 'year': int(year), 'viewBox': [0, 0, width, height],
+            'points': points.tolist(), 'source_points': int(len(x))}
+    # El SVG el último: es el que indica que el mapa ya existe
+    for ext, content in (('json', json.dumps(data)), ('svg', svg)):
+        atomic_write(os.path.join(DIRS['maps'], f"{stem}.{ext}"), lambda f: f.write(content), mode='w', encoding='utf-8')
+    return f"/maps/{stem}.svg", f"/maps/{stem}.json"
+
+def generate_track_map(session, gp_name, year, force=False):
+    stem = map_stem(gp_name, year)
+
+    # Si ya existe el archivo físico, devolvemos la URL
+    if os.path.exists(os.path.join(DIRS['maps'], f"{stem}.svg")) and not force: return f"/maps/{stem}.svg"
+
+    try:
+        # Esto puede fallar si no hay datos de posición
+        x, y = fastest_lap_positions(session)
+        return write_track_map(x, y, gp_name, year)[0]
+    except Exception as e:
+        print(f"[PY DEBUG] Error generando mapa: {e}", file=sys.stderr)
+        return None
+
+def build_race_context(gp_name, year, force_map=False, get_session=fastf1.get_session):
+    """Carga la carrera una vez y devuelve su contexto (con el mapa ya generado)."""
+    ctx = default_context(gp_name)
+    session = get_session(int(year), gp_name, 'R')
+    # La telemetría de toda la parrilla son cientos de MB que no se usan
+    session.load(laps=True, telemetry=False, weather=True, messages=False)
+
+    try:
+        w = getattr(session, 'weather_data', getattr(session, 'weather', None))
+        if w is not None and not w.empty:
+            ctx['track_temp'] = round(w['TrackTemp'].mean(), 1)
+            ctx['air_temp'] = round(w['AirTemp'].mean(), 1)
+    except: pass
+
+    try: ctx['total_laps'] = int(session.laps['LapNumber'].max())
+    except: pass
+
+    try: ctx['circuit_name'] = session.event['EventName']
+    except: pass
+
+    ctx['map_url'] = generate_track_map(session, gp_name, year, force=force_map)
+    ctx['map_data'] = ctx['map_url'][:-len('.svg')] + '.json' if ctx['map_url'] else None
+    ctx['tech_info'] = get_enrichment_data(ctx['circuit_name'])
+    return ctx
+
+def _build_job(gp_name, year, force_map):
+    # Se ejecuta en un proceso aparte: devolvemos el error en vez de lanzarlo
+    meter = MemoryMeter()
+    try: return gp_name, build_race_context(gp_name, year, force_map), None, meter.as_dict()
+    except Exception as e: return gp_name, None, str(e), meter.as_dict()
+
+def season_events(year):
+    """GPs ya disputados de la temporada (los futuros no tienen sesión que cargar)."""
+    schedule = fastf1.get_event_schedule(int(year), include_testing=False)
+    schedule = schedule[schedule['EventDate'] < pd.Timestamp.now()]
+    return [str(name) for name in schedule['EventName']]
+
+def precompute_season(year, events=None, workers=CONTEXT_WORKERS, force=False, mgr=None):
+    """Genera en paralelo los contextos que faltan. Devuelve {gp: error} de los que fallan."""
+    mgr = mgr if mgr is not None else RaceContextManager()
+    events = events if events is not None else season_events(year)
+    pending = [gp for gp in events if force or not (mgr.get_context(gp, year) or {}).get('map_data')]
+    print(f"📅 {year}: {len(events)} eventos, {len(pending)} por calcular ({workers} procesos)")
+
+    failed = {}
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [executor.submit(_build_job, gp, year, force) for gp in pending]
+        for future in as_completed(futures):
+            gp_name, ctx, error, memory = future.result()
+            if ctx is None:
+                failed[gp_name] = error
+                print(f"   ❌ {gp_name}: {error}")
+                continue
+            mgr.save_context(gp_name, year, ctx)
+            # Los procesos del pool se reutilizan: max_rss_mb es el pico de toda su vida, no del GP.
+            # Lo propio del GP es cuánto lo ha subido (0 si ha cabido en memoria ya usada)
+            print(f"   ✅ {gp_name}: {ctx['total_laps']} vueltas, mapa {'OK' if ctx['map_url'] else 'no disponible'}"
+                  f" (memoria: +{memory.get('peak_growth_mb', '?')} MB, pico del proceso {memory.get('max_rss_mb', '?')} MB)")
+    return failed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precálculo de contextos de carrera y mapas")
+    parser.add_argument('years', type=int, nargs='+', help="Temporadas a precalcular")
+    parser.add_argument('--gp', action='append', help="Limitar a estos GPs (repetible)")
+    parser.add_argument('--workers', type=int, default=CONTEXT_WORKERS, help="Procesos en paralelo")
+    parser.add_argument('--force', action='store_true', help="Regenerar aunque ya exista")
+    args = parser.parse_args()
+
+    mgr = RaceContextManager()
+    failed = {}
+    for year in args.years:
+        try: errors = precompute_season(year, events=args.gp, workers=args.workers, force=args.force, mgr=mgr)
+        except Exception as e: errors = {'(calendario)': str(e)}
+        failed.update({f"{year} {gp}": error for gp, error in errors.items()})
+
+    # Código de salida distinto de 0 si falta algún contexto (el build de la imagen falla)
+    if failed:
+        print(f"❌ {len(failed)} contextos sin calcular:")
+        for gp, error in sorted(failed.items()): print(f"   {gp}: {error}")
+        sys.exit(1)
@@ -1,17 +1,14 @@
 import pandas as pd
 import numpy as np
-import joblib
 import os
-import fastf1
 import json
 import sys
 import warnings
-from itertools import product
-
-# FIX MATPLOTLIB
-import matplotlib
-matplotlib.use('Agg') 
-import matplotlib.pyplot as plt
+import heapq
+from itertools import count
+from f1_race_context import RaceContextManager, default_context, get_enrichment_data
+from f1_flat_model import ModelRegistry
+from f1_timing import StageTimer, log_timings
 
 # ==========================================
 # ⚙️ CONFIGURACIÓN
@@ -21,53 +18,13 @@ BACKEND_DIR = os.path.dirname(SCRIPT_DIR)
 
 DIRS = {
     'models': os.path.join(BACKEND_DIR, 'models'),
-    'cache': os.path.join(BACKEND_DIR, 'f1_cache'),
     'data': os.path.join(BACKEND_DIR, 'data'),
-    'output': os.path.join(BACKEND_DIR, 'public', 'strategies'),
-    'maps': os.path.join(BACKEND_DIR, 'public', 'maps') # Asegúrate que esta carpeta exista
+    'output': os.path.join(BACKEND_DIR, 'public', 'strategies')
 }
 
 for d in DIRS.values(): os.makedirs(d, exist_ok=True)
 
 warnings.filterwarnings('ignore')
-try: fastf1.Cache.enable_cache(DIRS['cache'])
-except: pass
-
-plt.style.use('dark_background')
-
-# --- DB TÉCNICA ---
-CIRCUIT_DB = {
-    'bahrain': {'deg': 'HIGH', 'downforce': 'MEDIUM', 'overtake': 'EASY'},
-    'saudi':   {'deg': 'MEDIUM', 'downforce': 'LOW', 'overtake': 'MEDIUM'},
-    'austral': {'deg': 'MEDIUM', 'downforce': 'HIGH', 'overtake': 'HARD'},
-    'azerba':  {'deg': 'LOW', 'downforce': 'LOW', 'overtake': 'EASY'},
-    'miami':   {'deg': 'MEDIUM', 'downforce': 'MEDIUM', 'overtake': 'MEDIUM'},
-    'monaco':  {'deg': 'LOW', 'downforce': 'MAXIMUM', 'overtake': 'IMPOSSIBLE'},
-    'spain':   {'deg': 'HIGH', 'downforce': 'HIGH', 'overtake': 'MEDIUM'},
-    'spani':   {'deg': 'HIGH', 'downforce': 'HIGH', 'overtake': 'MEDIUM'},
-    'canad':   {'deg': 'MEDIUM', 'downforce': 'LOW', 'overtake': 'EASY'},
-    'austri':  {'deg': 'HIGH', 'downforce': 'MEDIUM', 'overtake': 'EASY'},
-    'brit':    {'deg': 'HIGH', 'downforce': 'HIGH', 'overtake': 'HARD'},
-    'silver':  {'deg': 'HIGH', 'downforce': 'HIGH', 'overtake': 'HARD'},
-    'hungar':  {'deg': 'MEDIUM', 'downforce': 'MAXIMUM', 'overtake': 'HARD'},
-    'belgi':   {'deg': 'HIGH', 'downforce': 'LOW', 'overtake': 'EASY'},
-    'spa':     {'deg': 'HIGH', 'downforce': 'LOW', 'overtake': 'EASY'},
-    'dutch':   {'deg': 'HIGH', 'downforce': 'HIGH', 'overtake': 'HARD'},
-    'nether':  {'deg': 'HIGH', 'downforce': 'HIGH', 'overtake': 'HARD'},
-    'ital':    {'deg': 'LOW', 'downforce': 'MINIMUM', 'overtake': 'EASY'},
-    'monza':   {'deg': 'LOW', 'downforce': 'MINIMUM', 'overtake': 'EASY'},
-    'singap':  {'deg': 'HIGH', 'downforce': 'MAXIMUM', 'overtake': 'HARD'},
-    'japan':   {'deg': 'HIGH', 'downforce': 'HIGH', 'overtake': 'MEDIUM'},
-    'suzuka':  {'deg': 'HIGH', 'downforce': 'HIGH', 'overtake': 'MEDIUM'},
-    'qatar':   {'deg': 'HIGH', 'downforce': 'HIGH', 'overtake': 'MEDIUM'},
-    'austin':  {'deg': 'MEDIUM', 'downforce': 'HIGH', 'overtake': 'EASY'},
-    'united':  {'deg': 'MEDIUM', 'downforce': 'HIGH', 'overtake': 'EASY'},
-    'mexic':   {'deg': 'MEDIUM', 'downforce': 'MAXIMUM', 'overtake': 'MEDIUM'},
-    'brazil':  {'deg': 'MEDIUM', 'downforce': 'MEDIUM', 'overtake': 'EASY'},
-    'paulo':   {'deg': 'MEDIUM', 'downforce': 'MEDIUM', 'overtake': 'EASY'},
-    'vegas':   {'deg': 'LOW', 'downforce': 'LOW', 'overtake': 'EASY'},
-    'dhabi':   {'deg': 'MEDIUM', 'downforce': 'MEDIUM', 'overtake': 'HARD'}
-}
 
 # Reglas
 LAUNCH_PENALTY = {'SOFT': 0.0, 'MEDIUM': 1.5, 'HARD': 4.0}
@@ -75,198 +32,445 @@ TYRE_LIMIT_PCT = {'SOFT': 0.35, 'MEDIUM': 0.60, 'HARD': 0.75}
 COMPOUND_RANK = {'SOFT': 1, 'MEDIUM': 2, 'HARD': 3}
 MULTI_STOP_BIAS = 5.0
 
-class RaceContextManager:
-    def __init__(self):
-        self.path = os.path.join(DIRS['data'], 'race_contexts.json')
-        self.data = self._load()
-    def _load(self):
-        if os.path.exists(self.path):
-            try: return json.load(open(self.path, 'r'))
-            except: return {}
-        return {}
-    def save_context(self, gp_name, year, data):
-        key = f"{year}_{gp_name}"
-        self.data[key] = data
-        try: json.dump(self.data, open(self.path, 'w'), indent=4)
-        except: pass
-    def get_context(self, gp_name, year):
-        return self.data.get(f"{year}_{gp_name}")
+# Búsqueda de estrategias (óptimos exactos a resolución de 1 vuelta)
+COMPOUNDS = ['SOFT', 'MEDIUM', 'HARD']
+MIN_STOPS = 0
+MAX_STOPS = 4
+TOP_K = 5
+TWO_COMPOUND_RULE = True   # Carrera en seco: al menos dos compuestos distintos
+BOUND_EPS = 1e-9           # Holgura numérica al podar con la cota inferior
+
+# Modo robustez (Monte Carlo): escenarios de safety car, pérdida en boxes y temperatura
+MC_SCENARIOS = 2000
+MC_MAX_SCENARIOS = 20000
+MC_SEED = 42               # Misma petición -> mismos escenarios
+MC_POOL = 200              # Candidatas que devuelve el optimizador antes de diversificar
+MC_PER_SEQUENCE = 3        # Máximo de variantes por secuencia de compuestos
+MC_CANDIDATES = 40
+SC_PROB = 0.5              # Probabilidad de safety car en la carrera
+SC_LAPS = (3, 6)           # Duración (vueltas) del safety car, mín. y máx.
+SC_LAP_DELTA = 25.0        # s más lenta cada vuelta bajo safety car (igual para todas)
+SC_PIT_FACTOR = 0.5        # Parar con safety car cuesta esta fracción de la pérdida normal
+PIT_LOSS_SD = 1.5          # s de desviación por parada
+TEMP_OFFSET_SD = 3.0       # ºC de desviación de la temperatura de pista media
+TEMP_DRIFT_SD = 3.0        # ºC de deriva entre la salida y el final de la carrera
+MC_TEMP_STEP = 5.0         # ºC para la derivada numérica con el modelo
+LAPTABLE_TOP_SPEED_TOL = 2.0   # Margen (km/h) para usar la tabla precalculada
+LAPTABLE_TEMP_TOL = 1.0        # Margen (ºC) respecto a un clima tabulado; fuera de él se usa el modelo
+
+# Modelos ya cargados en este proceso (formato plano con mmap o .pkl antiguo), con LRU.
+# En modo worker (f1_worker.py) evita volver a cargar el modelo en cada petición.
+MODEL_REGISTRY = ModelRegistry(DIRS['models'])
+# Índices de tablas de tiempos precalculadas (f1_deg_pipeline.export_lap_tables): {ruta: (mtime, index)}
+_LAPTABLE_CACHE = {}
 
 class StrategySimulator:
-    def __init__(self, driver_code, gp_name, year):
+    def __init__(self, driver_code, gp_name, year, mgr=None, timer=None):
         self.driver = driver_code
         self.gp_name = gp_name
         self.year = int(year)
-        self.mgr = RaceContextManager()
-        self.pkg = self._load_model()
-        self.ctx = self._get_race_context()
-
-    def _load_model(self):
-        path = os.path.join(DIRS['models'], f'{self.driver}_pkg.pkl')
-        if not os.path.exists(path):
+        self.mgr = mgr if mgr is not None else RaceContextManager()
+        self.timer = timer if timer is not None else StageTimer()
+        self.laptable_dir = os.path.join(DIRS['models'], 'laptables', self.driver)
+        if not MODEL_REGISTRY.exists(self.driver) and not os.path.exists(self.laptable_dir):
             raise FileNotFoundError(f"No existe modelo para {self.driver}")
-        return joblib.load(path)
+        self._pkg = None
+        with self.timer.stage('context'): self.ctx = self._get_race_context()
+        with self.timer.stage('lap_table'): self.lap_table = self._load_lap_table()
 
-    def _generate_track_map(self, session, safe_gp_name):
-        filename = f"{self.year}_{safe_gp_name}_Map.png"
-        filepath = os.path.join(DIRS['maps'], filename)
-        
-        # Si ya existe el archivo físico, devolvemos la URL
-        if os.path.exists(filepath): return f"/maps/{filename}"
+    @property
+    def pkg(self):
+        # El modelo solo se carga si la tabla precalculada no cubre la petición
+        if self._pkg is None:
+            with self.timer.stage('model_load'): self._pkg = self._load_model()
+        return self._pkg
 
+    def _load_lap_table(self):
+        # Las tablas son del modelo propio del piloto: con el modelo común se predice directamente
+        if MODEL_REGISTRY.is_global(self.driver): return None
+        index_path = os.path.join(self.laptable_dir, 'index.json')
+        if not os.path.exists(index_path): return None
+        mtime = os.path.getmtime(index_path)
+        cached = _LAPTABLE_CACHE.get(index_path)
+        if cached and cached[0] == mtime:
+            index = cached[1]
+        else:
+            try: index = json.load(open(index_path, 'r'))
+            except: return None
+            _LAPTABLE_CACHE[index_path] = (mtime, index)
+
+        entry = index['circuits'].get(self.ctx['circuit_name'])
+        if entry is None or self.ctx['total_laps'] > entry['laps']: return None
+        if abs(self.ctx.get('avg_top_speed', 300) - index['top_speed']) > LAPTABLE_TOP_SPEED_TOL: return None
+
+        # Clima tabulado más cercano al de la carrera
+        deltas = [(self.ctx['track_temp'] - t, self.ctx['air_temp'] - a) for t, a in entry['weathers']]
+        slab = min(range(len(deltas)), key=lambda i: max(abs(deltas[i][0]), abs(deltas[i][1])))
+        if max(abs(deltas[slab][0]), abs(deltas[slab][1])) > LAPTABLE_TEMP_TOL: return None
         try:
-            lap = session.laps.pick_fastest()
-            # Esto puede fallar si no hay datos de posición
-            tel = lap.get_telemetry()
-            
-            fig, ax = plt.subplots(figsize=(6, 4))
-            ax.plot(tel['X'], tel['Y'], color='#ff3333', linewidth=3)
-            ax.axis('off')
-            fig.patch.set_facecolor('#1e1e1e')
-            ax.set_facecolor('#1e1e1e')
-            plt.tight_layout()
-            plt.savefig(filepath, facecolor='#1e1e1e', dpi=100, bbox_inches='tight', pad_inches=0)
-            plt.close(fig)
-            return f"/maps/{filename}"
-        except Exception as e:
-            # IMPRIMIR ERROR EN LOG DE NODE PARA DEPURAR
-            print(f"[PY DEBUG] Error generando mapa: {e}", file=sys.stderr)
-            return None
-
-    def _get_enrichment_data(self, gp_name):
-        name_lower = gp_name.lower()
-        for key, val in CIRCUIT_DB.items():
-            if key in name_lower: return val
-        return {'deg': 'UNKNOWN', 'downforce': 'UNKNOWN', 'overtake': 'UNKNOWN'}
+            table = np.load(os.path.join(self.laptable_dir, entry['file']), mmap_mode='r')
+            sens = np.load(os.path.join(self.laptable_dir, entry['sens_file']))
+        except: return None
+        return {'entry': entry, 'compounds': index['compounds'], 'table': table[slab],
+                'sens': sens, 'delta': deltas[slab]}
+
+    def _load_model(self):
+        return MODEL_REGISTRY.get(self.driver)
 
     def _get_race_context(self):
-        cached = self.mgr.get_context(self.gp_name, self.year)
-        
-        # --- FIX: VALIDAR QUE LA CACHÉ TENGA MAPA VÁLIDO ---
-        # Si map_url es null o no existe, forzamos regeneración
-        if cached and cached.get('map_url') and cached.get('tech_info'):
-            return cached
-
-        print(f"[PY DEBUG] Generando contexto y mapa para {self.gp_name}...", file=sys.stderr)
-
-        ctx = {'total_laps': 57, 'track_temp': 35.0, 'air_temp': 25.0, 
-               'pit_loss': 22.5, 'circuit_name': self.gp_name, 'avg_top_speed': 300.0,
-               'map_url': None, 'tech_info': self._get_enrichment_data(self.gp_name)}
-        try:
-            session = fastf1.get_session(self.year, self.gp_name, 'R')
-            session.load(laps=True, telemetry=True, weather=True, messages=False)
-            
-            try:
-                w = getattr(session, 'weather_data', getattr(session, 'weather', None))
-                if w is not None and not w.empty:
-                    ctx['track_temp'] = round(w['TrackTemp'].mean(), 1)
-                    ctx['air_temp'] = round(w['AirTemp'].mean(), 1)
-            except: pass
-            
-            try: ctx['total_laps'] = int(session.laps['LapNumber'].max())
-            except: pass
-            
-            try:
-                pit_laps = session.laps[session.laps['PitOutTime'].notna()]
-                if not pit_laps.empty: ctx['pit_loss'] = 22.5
-            except: pass
-            
-            try: ctx['circuit_name'] = session.event['EventName']
-            except: pass
-            
-            # Generar mapa
-            safe_gp = self.gp_name.replace(' ', '_')
-            ctx['map_url'] = self._generate_track_map(session, safe_gp)
-            ctx['tech_info'] = self._get_enrichment_data(session.event['EventName'])
-
-            self.mgr.save_context(self.gp_name, self.year, ctx)
-            return ctx
-        except Exception as e:
-            print(f"[PY DEBUG] Error general contexto: {e}", file=sys.stderr)
-            return ctx
+        # Solo lectura: los contextos se generan por lotes con f1_race_context.py
+        ctx = self.mgr.get_context(self.gp_name, self.year)
+        if ctx is None:
+            raise ValueError(f"No hay contexto precalculado para {self.gp_name} {self.year} "
+                             f"(ejecuta: python f1_race_context.py {self.year})")
+        ctx = {**default_context(self.gp_name), **ctx}
+        if not ctx.get('tech_info'): ctx['tech_info'] = get_enrichment_data(ctx['circuit_name'])
+        return ctx
 
-    def predict_stint_time(self, compound, start_lap, length):
-        model = self.pkg['model']
-        c_enc = self.pkg['compound_encoder']
-        circ_enc = self.pkg['circuit_encoder']
-        try: c_val = c_enc.transform([str(compound)])[0]
-        except: c_val = 0 
-        try: circ_val = circ_enc.transform([str(self.ctx['circuit_name'])])[0]
-        except: circ_val = 0 
+    def _encode(self, encoder, value):
+        try: return encoder.transform([str(value)])[0]
+        except: return 0
+
+    def _stint_features(self, compound, start_lap, length):
         input_matrix = np.zeros((length, 8))
         input_matrix[:, 0] = np.arange(1, length + 1)
         input_matrix[:, 1] = np.arange(start_lap, start_lap + length)
-        input_matrix[:, 2] = c_val
-        input_matrix[:, 3] = circ_val
+        input_matrix[:, 2] = self._encode(self.pkg['compound_encoder'], compound)
+        input_matrix[:, 3] = self._encode(self.pkg['circuit_encoder'], self.ctx['circuit_name'])
         input_matrix[:, 4] = self.ctx['track_temp']
         input_matrix[:, 5] = self.ctx['air_temp']
         input_matrix[:, 6] = 1
         input_matrix[:, 7] = self.ctx.get('avg_top_speed', 300)
-        return np.sum(model.predict(input_matrix))
+        return input_matrix
+
+    def predict_stint_time(self, compound, start_lap, length):
+        return np.sum(self.pkg['model'].predict(self._stint_features(compound, start_lap, length)))
+
+    def build_stint_table(self, max_life):
+        """
+        Tiempo de todos los stints posibles con una sola llamada a predict.
+        table[c, s-1, n-1] = tiempo de un stint de n vueltas con el compuesto c empezando en la vuelta s.
+        """
+        # Suma acumulada sobre la vida del neumático -> coste del stint en O(1)
+        return np.cumsum(self._lap_time_grid(max_life), axis=2)
+
+    def _lap_time_grid(self, max_life, track_offset=0.0):
+        """Tiempo por vuelta en la rejilla (compuesto, vuelta de salida, vida); inf fuera de la carrera."""
+        laps = self.ctx['total_laps']
+        max_life = min(max_life, laps)
+        # Rejilla (compuesto, vuelta de salida, vida del neumático); la vuelta de
+        # carrera de cada celda es salida + vida - 1
+        c_idx, start, life = np.meshgrid(np.arange(len(COMPOUNDS)), np.arange(1, laps + 1),
+                                         np.arange(1, max_life + 1), indexing='ij')
+        race_lap = start + life - 1
+        valid = race_lap <= laps
+
+        lap_times = np.full(valid.shape, np.inf)
+        if self.lap_table is not None and max_life <= self.lap_table['entry']['max_life']:
+            lap_times[valid] = self._table_lap_times(c_idx[valid], race_lap[valid], life[valid], track_offset)
+            return lap_times
+
+        n = int(valid.sum())
+        X = np.zeros((n, 8))
+        X[:, 0] = life[valid]
+        X[:, 1] = race_lap[valid]
+        X[:, 2] = np.array([self._encode(self.pkg['compound_encoder'], c) for c in COMPOUNDS])[c_idx[valid]]
+        X[:, 3] = self._encode(self.pkg['circuit_encoder'], self.ctx['circuit_name'])
+        X[:, 4] = self.ctx['track_temp'] + track_offset
+        X[:, 5] = self.ctx['air_temp']
+        X[:, 6] = 1
+        X[:, 7] = self.ctx.get('avg_top_speed', 300)
+
+        lap_times[valid] = self.pkg['model'].predict(X)
+        return lap_times
+
+    def _table_lap_times(self, c_idx, race_lap, life, track_offset=0.0):
+        """Tiempo por vuelta desde la tabla precalculada, corregido linealmente por temperatura."""
+        comp_pos = np.array([self.lap_table['compounds'].index(c) for c in COMPOUNDS])
+        d_track, d_air = self.lap_table['delta']
+        d_track = d_track + track_offset
+        sens = self.lap_table['sens']
+        # Solo se leen de disco las páginas de las celdas pedidas
+        lap_times = np.asarray(self.lap_table['table'][comp_pos[c_idx], race_lap - 1, life - 1], dtype=np.float64)
+        return lap_times + sens[0][comp_pos[c_idx], life - 1] * d_track + sens[1][comp_pos[c_idx], life - 1] * d_air
+
+    def _stint_limits(self, i, n_stints, compound, max_lives, laps):
+        """
+        Longitud mínima y máxima (incluidas) del stint i (0 = salida) en una estrategia de n_stints.
+        Son los límites de la búsqueda original: a 1 parada, primer stint >= 5 y último >= 6;
+        a varias, stints intermedios >= 10 y último >= 11. Solo el último puede agotar
+        la vida del neumático; los demás se quedan a una vuelta.
+        """
+        last = i == n_stints - 1
+        if n_stints == 2: lo = 6 if last else 5
+        else: lo = 11 if last else 10
+        hi = max_lives[compound] if last else max_lives[compound] - 1
+        # En estrategias de varias paradas el primer stint no pasa de media carrera
+        if i == 0 and n_stints > 2: hi = min(hi, int(laps * 0.5) - 1)
+        return lo, min(hi, laps)
+
+    def _allowed_compounds(self, i, first):
+        # El primer compuesto es siempre el más blando de la estrategia
+        if i == 0: return [first]
+        return [c for c in COMPOUNDS if COMPOUND_RANK[c] >= COMPOUND_RANK[first]]
 
-    def find_best_strategies(self):
+    def _cost_to_go(self, stops, first, table, max_lives, laps):
+        """
+        Programación dinámica hacia atrás sobre (stint, vuelta, compuestos usados).
+        g[i][p, mask] = mejor coste de los stints i..último empezando en la vuelta p (base 0)
+        con los compuestos de `mask` ya usados. Es exacta, así que sirve de cota inferior.
+        """
+        n_stints = stops + 1
+        g = np.full((n_stints + 1, laps + 1, 1 << len(COMPOUNDS)), np.inf)
+        for mask in range(1 << len(COMPOUNDS)):
+            if not TWO_COMPOUND_RULE or bin(mask).count('1') >= 2: g[n_stints, laps, mask] = 0.0
+
+        first_bit = 1 << COMPOUNDS.index(first)
+        allowed_bits = sum(1 << COMPOUNDS.index(c) for c in self._allowed_compounds(1, first))
+        p = np.arange(laps)[:, None]
+        for i in range(n_stints - 1, -1, -1):
+            # Solo los conjuntos de compuestos alcanzables antes del stint i
+            masks = [0] if i == 0 else [m for m in range(1 << len(COMPOUNDS))
+                                        if m & first_bit and not m & ~allowed_bits]
+            for c in self._allowed_compounds(i, first):
+                lo, hi = self._stint_limits(i, n_stints, c, max_lives, laps)
+                if lo > hi: continue
+                ci = COMPOUNDS.index(c)
+                stint = table[ci, :, lo - 1:hi]                       # (vuelta de salida, longitud)
+                nxt = np.minimum(p + np.arange(lo, hi + 1)[None, :], laps)
+                for mask in masks:
+                    best = (stint + g[i + 1][nxt, mask | (1 << ci)]).min(axis=1)
+                    g[i, :laps, mask] = np.minimum(g[i, :laps, mask], best)
+        return g
+
+    def _branch_and_bound(self, stops, first, g, table, max_lives, laps, heap, tie, top_k):
+        """Recorre stints en orden de cota inferior y poda las ramas que no pueden entrar en el top-K."""
+        n_stints = stops + 1
+
+        def worst():
+            return -heap[0][0] if len(heap) >= top_k else np.inf
+
+        def visit(i, p, mask, cost, stints):
+            if i == n_stints:
+                entry = (-cost, next(tie), stints)
+                if len(heap) < top_k: heapq.heappush(heap, entry)
+                else: heapq.heappushpop(heap, entry)
+                return
+            options = []
+            for c in self._allowed_compounds(i, first):
+                lo, hi = self._stint_limits(i, n_stints, c, max_lives, laps)
+                hi = min(hi, laps - p)
+                if lo > hi: continue
+                ci = COMPOUNDS.index(c)
+                lengths = np.arange(lo, hi + 1)
+                stint = table[ci, p, lengths - 1]
+                bound = cost + stint + g[i + 1][p + lengths, mask | (1 << ci)]
+                options.extend(zip(bound.tolist(), [c] * len(lengths), lengths.tolist(), stint.tolist()))
+            options.sort(key=lambda o: o[0])
+            for bound, c, n, stint_cost in options:
+                if not np.isfinite(bound) or bound > worst() + BOUND_EPS: break
+                visit(i + 1, p + n, mask | (1 << COMPOUNDS.index(c)), cost + stint_cost, stints + [(c, n)])
+
+        const = self.ctx['pit_loss'] * stops + LAUNCH_PENALTY.get(first, 0) + MULTI_STOP_BIAS * max(stops - 1, 0)
+        visit(0, 0, 0, const, [])
+
+    def find_best_strategies(self, top_k=TOP_K, on_improve=None):
+        """
+        Top-K exacto. Con on_improve(resultados) se avisa cada vez que mejora el top-K
+        y se exploran primero las raíces de 1 parada (primer resultado útil cuanto antes).
+        """
         laps = self.ctx['total_laps']
-        compounds = ['SOFT', 'MEDIUM', 'HARD']
+        max_lives = {k: int(laps * pct) for k, pct in TYRE_LIMIT_PCT.items()}
+        if getattr(self, '_stint_table', None) is None:
+            with self.timer.stage('stint_table'): self._stint_table = self.build_stint_table(max(max_lives.values()))
+        table = self._stint_table
+
+        with self.timer.stage('search'):
+            # Cotas exactas por (paradas, compuesto de salida); se exploran de la más prometedora a la peor
+            roots = []
+            for stops in range(MIN_STOPS, MAX_STOPS + 1):
+                for first in COMPOUNDS:
+                    g = self._cost_to_go(stops, first, table, max_lives, laps)
+                    const = self.ctx['pit_loss'] * stops + LAUNCH_PENALTY.get(first, 0) + MULTI_STOP_BIAS * max(stops - 1, 0)
+                    if np.isfinite(g[0][0, 0]): roots.append((const + g[0][0, 0], stops, first, g))
+            if on_improve is None: roots.sort(key=lambda r: r[0])
+            else: roots.sort(key=lambda r: (r[1] != 1, r[0]))
+
+            heap, tie = [], count()  # Top-K acotado: el peor de los K arriba del montículo
+            for bound, stops, first, g in roots:
+                if len(heap) >= top_k and bound > -heap[0][0] + BOUND_EPS:
+                    if on_improve is None: break
+                    continue  # Sin ordenar solo por cota, una raíz podada no implica que lo estén las siguientes
+                before = sorted(e[0] for e in heap)
+                self._branch_and_bound(stops, first, g, table, max_lives, laps, heap, tie, top_k)
+                if on_improve is not None and sorted(e[0] for e in heap) != before:
+                    on_improve(self._heap_results(heap))
+
+        return self._heap_results(heap)
+
+    def _heap_results(self, heap):
         results = []
+        for neg_cost, _, stints in sorted(heap, key=lambda e: -e[0]):
+            lengths = [n for _, n in stints]
+            stops = len(stints) - 1
+            results.append({'type': 'No Stop' if stops == 0 else ('1 Stop' if stops == 1 else f'{stops} Stops'),
+                            'compounds': [c for c, _ in stints], 'laps': lengths,
+                            'stop_laps': np.cumsum(lengths)[:-1].tolist(), 'total_time': -neg_cost})
+        return results
+
+    def _robust_candidates(self):
+        """Las mejores variantes de cada secuencia de compuestos (no 40 versiones del mismo 1 Stop)."""
+        per_sequence, candidates = {}, []
+        for s in self.find_best_strategies(top_k=MC_POOL):
+            key = tuple(s['compounds'])
+            if per_sequence.get(key, 0) >= MC_PER_SEQUENCE: continue
+            per_sequence[key] = per_sequence.get(key, 0) + 1
+            candidates.append(s)
+            if len(candidates) >= MC_CANDIDATES: break
+        return candidates
+
+    def _temperature_sensitivity(self, max_life):
+        """
+        ∂(tiempo por vuelta)/∂TrackTemp en la rejilla (compuesto, salida, vida).
+        Con tabla precalculada se usa su sensibilidad; si no, diferencia central del modelo.
+        """
+        if self.lap_table is not None and max_life <= self.lap_table['entry']['max_life']:
+            return self._lap_time_grid(max_life, track_offset=1.0) - self._lap_time_grid(max_life)
+        up = self._lap_time_grid(max_life, track_offset=MC_TEMP_STEP)
+        down = self._lap_time_grid(max_life, track_offset=-MC_TEMP_STEP)
+        return (up - down) / (2 * MC_TEMP_STEP)
+
+    def simulate_robustness(self, n_scenarios=MC_SCENARIOS, seed=MC_SEED):
+        """
+        Evalúa las candidatas contra n_scenarios escenarios aleatorios de una vez:
+        tiempos (escenario, estrategia) = base + temperatura + ruido en boxes - ahorro con safety car.
+        Devuelve las TOP_K por tiempo esperado, con percentiles y probabilidad de ser la más rápida.
+        """
+        laps = self.ctx['total_laps']
         max_lives = {k: int(laps * pct) for k, pct in TYRE_LIMIT_PCT.items()}
+        with self.timer.stage('mc_candidates'): candidates = self._robust_candidates()
+        if not candidates: return []
+        n_scenarios = int(min(max(n_scenarios, 1), MC_MAX_SCENARIOS))
+
+        with self.timer.stage('mc_sensitivity'):
+            # Costes de temperatura por stint: desplazamiento uniforme (A) y deriva lineal en la carrera (B)
+            sens = np.nan_to_num(self._temperature_sensitivity(max(max_lives.values())), posinf=0.0, neginf=0.0)
+            start = np.arange(1, laps + 1)[None, :, None]
+            race_lap = start + np.arange(sens.shape[2])[None, None, :]
+            sens_a = np.cumsum(sens, axis=2)
+            sens_b = np.cumsum(sens * race_lap / laps, axis=2)
+
+            # Candidatas como arrays (estrategia, stint), rellenando con stints vacíos
+            max_stints = MAX_STOPS + 1
+            comp = np.zeros((len(candidates), max_stints), dtype=int)
+            first_lap = np.zeros((len(candidates), max_stints), dtype=int)
+            length = np.zeros((len(candidates), max_stints), dtype=int)
+            stop_laps = np.full((len(candidates), MAX_STOPS), -1)
+            for j, s in enumerate(candidates):
+                n = len(s['laps'])
+                comp[j, :n] = [COMPOUNDS.index(c) for c in s['compounds']]
+                length[j, :n] = s['laps']
+                first_lap[j, :n] = np.cumsum(s['laps']) - s['laps']
+                stop_laps[j, :n - 1] = s['stop_laps']
+            used = length > 0
+            a = np.where(used, sens_a[comp, first_lap, np.maximum(length, 1) - 1], 0.0).sum(axis=1)
+            b = np.where(used, sens_b[comp, first_lap, np.maximum(length, 1) - 1], 0.0).sum(axis=1)
+            base = np.array([s['total_time'] for s in candidates])
+            is_stop = stop_laps >= 0
+
+        with self.timer.stage('mc_simulation'):
+            rng = np.random.default_rng(seed)
+            offset = rng.normal(0.0, TEMP_OFFSET_SD, n_scenarios)
+            drift = rng.normal(0.0, TEMP_DRIFT_SD, n_scenarios)
+            pit = self.ctx['pit_loss'] + rng.normal(0.0, PIT_LOSS_SD, (n_scenarios, MAX_STOPS))
+            has_sc = rng.random(n_scenarios) < SC_PROB
+            sc_len = rng.integers(SC_LAPS[0], SC_LAPS[1] + 1, n_scenarios)
+            sc_start = rng.integers(1, np.maximum(laps - sc_len, 2))
 
-        for c1, c2 in product(compounds, repeat=2):
-            if c1 == c2: continue
-            if COMPOUND_RANK[c1] > COMPOUND_RANK[c2]: continue
-            if max_lives[c1] + max_lives[c2] < laps: continue
-            launch_cost = LAUNCH_PENALTY.get(c1, 0)
-            start, end = max(5, laps - max_lives[c2]), min(max_lives[c1], laps - 5)
-            for stop in range(start, end, 2):
-                if stop > max_lives[c1] or (laps-stop) > max_lives[c2]: continue
-                t1 = self.predict_stint_time(c1, 1, stop)
-                t2 = self.predict_stint_time(c2, stop+1, laps-stop)
-                results.append({'type': '1 Stop', 'compounds': [c1, c2], 'laps': [stop, laps-stop], 'stop_laps': [stop], 'total_time': t1+t2+self.ctx['pit_loss']+launch_cost})
-
-        for c1, c2, c3 in product(compounds, repeat=3):
-            if len(set([c1, c2, c3])) < 2: continue
-            softest = min(COMPOUND_RANK[c1], COMPOUND_RANK[c2], COMPOUND_RANK[c3])
-            if COMPOUND_RANK[c1] != softest: continue 
-            if max_lives[c1] + max_lives[c2] + max_lives[c3] < laps: continue
-            launch_cost = LAUNCH_PENALTY.get(c1, 0)
-            for s1 in range(10, min(max_lives[c1], int(laps*0.5)), 3):
-                limit_s2 = min(max_lives[c2], laps - s1 - 10)
-                for len2 in range(10, limit_s2, 3):
-                    len3 = laps - (s1 + len2)
-                    if len3 > max_lives[c3] or len3 < 5: continue
-                    t1 = self.predict_stint_time(c1, 1, s1)
-                    t2 = self.predict_stint_time(c2, s1+1, len2)
-                    t3 = self.predict_stint_time(c3, s1+len2+1, len3)
-                    total = t1+t2+t3+(self.ctx['pit_loss']*2)+launch_cost+MULTI_STOP_BIAS
-                    results.append({'type': '2 Stops', 'compounds': [c1, c2, c3], 'laps': [s1, len2, len3], 'stop_laps': [s1, s1+len2], 'total_time': total})
-
-        results.sort(key=lambda x: x['total_time'])
-        return results[:5]
+            # Parada k de la estrategia j dentro de la ventana de safety car del escenario i
+            in_sc = (has_sc[:, None, None] & (stop_laps[None] >= sc_start[:, None, None])
+                     & (stop_laps[None] < (sc_start + sc_len)[:, None, None]))
+            pit_cost = np.where(in_sc, pit[:, None, :] * SC_PIT_FACTOR, pit[:, None, :])
+            pit_delta = (np.where(is_stop[None], pit_cost, 0.0).sum(axis=2)
+                         - self.ctx['pit_loss'] * is_stop.sum(axis=1)[None, :])
+            totals = (base[None, :] + offset[:, None] * a[None, :] + drift[:, None] * b[None, :] + pit_delta
+                      + (has_sc * sc_len * SC_LAP_DELTA)[:, None])
+
+            mean = totals.mean(axis=0)
+            p10, p50, p90 = np.percentile(totals, [10, 50, 90], axis=0)
+            wins = np.bincount(totals.argmin(axis=1), minlength=len(candidates)) / n_scenarios
+
+        order = np.argsort(mean)[:TOP_K]
+        return [{**candidates[j], 'deterministic_time': float(base[j]), 'expected_time': float(mean[j]),
+                 'std': float(totals[:, j].std()), 'p10': float(p10[j]), 'p50': float(p50[j]),
+                 'p90': float(p90[j]), 'win_prob': float(wins[j]), 'scenarios': n_scenarios} for j in order]
 
     def plot_strategies(self, strategies): return ""
 
+def format_race_time(total):
+    return f"{int(total//3600)}h {int((total%3600)//60)}m {int(total%60)}s"
+
+def build_strategy_response(driver, gp, year, mgr=None, robust=False, scenarios=MC_SCENARIOS, on_event=None):
+    """Ejecuta la simulación completa y devuelve el JSON que consume el frontend (con `timings` en ms).
+    Con robust=True añade `robust_strategies`: ranking por tiempo esperado en escenarios Monte Carlo.
+    Con on_event(tipo, respuesta_parcial) se emiten resultados intermedios con la misma forma:
+    'context' (sin estrategias), 'strategies' cada vez que mejora el top-K y, en modo robusto,
+    'deterministic' antes de la simulación Monte Carlo."""
+    timer = StageTimer()
+    sim = StrategySimulator(driver, gp, year, mgr=mgr, timer=timer)
+    on_improve = None
+    if on_event is not None:
+        on_event('context', {**_format_response(sim, driver, gp, year, []), "partial": True})
+        on_improve = lambda best: on_event('strategies', {**_format_response(sim, driver, gp, year, best), "partial": True})
+    best = sim.find_best_strategies(on_improve=on_improve)
+    if on_event is not None and robust:
+        on_event('deterministic', {**_format_response(sim, driver, gp, year, best), "partial": True})
+    robust_best = sim.simulate_robustness(scenarios) if robust else None
+    with timer.stage('response'):
+        response = _format_response(sim, driver, gp, year, best)
+        if robust_best is not None:
+            response["robust_strategies"] = [{
+                **_format_strategy(s), "expected_time": s['expected_time'],
+                "formatted_expected_time": format_race_time(s['expected_time']),
+                "p10": s['p10'], "p50": s['p50'], "p90": s['p90'], "std": s['std'],
+                "win_prob": s['win_prob'], "scenarios": s['scenarios']
+            } for s in robust_best]
+    response["timings"] = timer.as_dict()
+    return response
+
+def _format_response(sim, driver, gp, year, best):
+    response = {
+        "driver": driver, "gp": sim.ctx['circuit_name'], "year": year,
+        "circuit_info": {
+            "name": sim.ctx['circuit_name'], "location": gp,
+            "laps": sim.ctx['total_laps'], "track_temp": sim.ctx['track_temp'],
+            "air_temp": sim.ctx['air_temp'],
+            "map_url": sim.ctx.get('map_url'), "map_data": sim.ctx.get('map_data'),
+            "tech": sim.ctx.get('tech_info', {'deg': 'UNK', 'downforce': 'UNK', 'overtake': 'UNK'})
+        },
+        "image_url": "", "strategies": []
+    }
+    for s in best:
+        response["strategies"].append(_format_strategy(s))
+    return response
+
+def _format_strategy(s):
+    return {
+        "type": s['type'], "compounds": s['compounds'], "laps": [int(x) for x in s['laps']],
+        "stop_laps": [int(x) for x in s['stop_laps']], "total_time": float(s['total_time']),
+        "formatted_time": format_race_time(s['total_time'])
+    }
+
 if __name__ == "__main__":
     try:
         if len(sys.argv) >= 4:
             DRIVER, GP, YEAR = sys.argv[1], sys.argv[2], sys.argv[3]
-            sim = StrategySimulator(DRIVER, GP, YEAR)
-            best = sim.find_best_strategies()
-            response = {
-                "driver": DRIVER, "gp": sim.ctx['circuit_name'], "year": YEAR,
-                "circuit_info": {
-                    "name": sim.ctx['circuit_name'], "location": GP,
-                    "laps": sim.ctx['total_laps'], "track_temp": sim.ctx['track_temp'],
-                    "air_temp": sim.ctx['air_temp'],
-                    "map_url": sim.ctx.get('map_url'),
-                    "tech": sim.ctx.get('tech_info', {'deg': 'UNK', 'downforce': 'UNK', 'overtake': 'UNK'})
-                },
-                "image_url": "", "strategies": []
-            }
-            for s in best:
-                response["strategies"].append({
-                    "type": s['type'], "compounds": s['compounds'], "laps": [int(x) for x in s['laps']], 
-                    "stop_laps": [int(x) for x in s['stop_laps']], "total_time": float(s['total_time']),
-                    "formatted_time": f"{int(s['total_time']//3600)}h {int((s['total_time']%3600)//60)}m {int(s['total_time']%60)}s"
-                })
+            # --stream: NDJSON, un evento por línea ({"event": ..., "data": ...}) y la respuesta final
+            on_event = None
+            if '--stream' in sys.argv[4:]:
+                on_event = lambda kind, data: print(json.dumps({"event": kind, "data": data}), flush=True)
+            response = build_strategy_response(DRIVER, GP, YEAR, robust='--robust' in sys.argv[4:], on_event=on_event)
+            log_timings('strategy', {'driver': DRIVER, 'gp': GP, 'year': YEAR}, response['timings'])
             print(json.dumps(response))
         else: print(json.dumps({"error": "Missing Args"}))
     except Exception as e: print(json.dumps({"error": str(e)}))
\ No newline at end of file
@@ -0,0 +1,57 @@
+import os
+import gzip
+import json
+import glob
+from f1_files import atomic_write, slug
+
+# ==========================================
+# 💾 CACHÉ DE RESPUESTAS DE TELEMETRÍA
+# ==========================================
+# La telemetría histórica no cambia: guardamos el JSON final (gzip) por
+# (año, GP, piloto, parámetros de muestreo) y servimos las repeticiones sin
+# tocar FastF1. El tamaño total se limita expulsando los menos usados (LRU por mtime).
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(SCRIPT_DIR)
+CACHE_DIR = os.path.join(BACKEND_DIR, 'data', 'telemetry_cache')
+MAX_CACHE_MB = float(os.environ.get('RACESCOPE_TELEMETRY_CACHE_MB', 512))
+
+class TelemetryCache:
+    def __init__(self, root=CACHE_DIR, max_bytes=int(MAX_CACHE_MB * 1024 * 1024)):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, driver, gp_name, year, variant):
+        return os.path.join(self.root, f"{int(year)}_{slug(gp_name)}_{slug(driver)}_{slug(variant)}.json.gz")
+
+    def get(self, driver, gp_name, year, variant):
+        path = self.path(driver, gp_name, year, variant)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                payload = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Marca de uso para la expulsión LRU
+        try: os.utime(path)
+        except OSError: pass
+        return payload
+
+    def put(self, driver, gp_name, year, variant, payload):
+        path = self.path(driver, gp_name, year, variant)
+        atomic_write(path, lambda f: json.dump(payload, f, separators=(',', ':')), mode='wt',
+                     opener=gzip.open, encoding='utf-8')
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for path in glob.glob(os.path.join(self.root, '*.json.gz')):
+            try: st = os.stat(path)
+            except OSError: continue
+            entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes: break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError: pass
@@ -3,6 +3,11 @@ import sys
 import json
 import os
 import warnings
+import pandas as pd
+import numpy as np
+from collections import OrderedDict
+from f1_telemetry_cache import TelemetryCache
+from f1_timing import StageTimer
 
 # Configuración de caché y rutas
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -13,60 +18,257 @@ warnings.filterwarnings('ignore')
 try: fastf1.Cache.enable_cache(CACHE_DIR)
 except: pass
 
-def get_telemetry_data(driver_code, gp_name, year):
+# Sesiones con telemetría ya cargadas (LRU). Solo se aprovecha en modo worker,
+# donde el proceso sirve muchas peticiones; cada sesión ocupa bastante RAM.
+SESSION_CACHE_SIZE = int(os.environ.get('RACESCOPE_SESSION_CACHE', 2))
+_SESSION_CACHE = OrderedDict()
+
+# Respuestas ya calculadas en disco: las vueltas populares no tocan FastF1
+RESPONSE_CACHE = TelemetryCache()
+
+# Presupuesto de muestras por petición (points): fuera de este rango se recorta
+MIN_POINTS = 50
+MAX_POINTS = 5000
+
+def clamp_points(points):
+    return int(min(max(int(points), MIN_POINTS), MAX_POINTS))
+
+def load_race_session(gp_name, year):
+    key = (int(year), gp_name)
+    if key in _SESSION_CACHE:
+        _SESSION_CACHE.move_to_end(key)
+        return _SESSION_CACHE[key]
+    session = fastf1.get_session(int(year), gp_name, 'R')
+    session.load(laps=True, telemetry=True, weather=False, messages=False)
+    if SESSION_CACHE_SIZE > 0:
+        _SESSION_CACHE[key] = session
+        while len(_SESSION_CACHE) > SESSION_CACHE_SIZE:
+            _SESSION_CACHE.popitem(last=False)
+    return session
+
+def lttb_indices(x, y, n_out):
+    """Largest-Triangle-Three-Buckets: índices de n_out puntos que conservan la forma de y(x)."""
+    n = len(x)
+    if n_out >= n or n_out < 3: return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # n_out-2 cubos entre el primer y el último punto (que siempre se conservan)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    idx = np.empty(n_out, dtype=int)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            nxt = slice(edges[i + 1], edges[i + 2])
+            avg_x, avg_y = x[nxt].mean(), y[nxt].mean()
+        else:
+            avg_x, avg_y = x[-1], y[-1]
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        idx[i + 1] = a
+    return idx
+
+def adaptive_indices(car_data, points):
+    """
+    Diezmado adaptativo con presupuesto de `points` muestras: se conservan siempre
+    los puntos de frenada y cambio de marcha, y el resto se reparte con LTTB sobre la velocidad.
+    """
+    brake = car_data['Brake'].to_numpy(dtype=float)
+    gear = car_data['nGear'].to_numpy(dtype=float)
+    events = np.flatnonzero((np.diff(brake) != 0) | (np.diff(gear) != 0)) + 1
+    if len(events) > points // 2:
+        events = events[np.linspace(0, len(events) - 1, points // 2).astype(int)]
+    shape = lttb_indices(car_data['Distance'].to_numpy(dtype=float), car_data['Speed'].to_numpy(dtype=float),
+                         max(3, points - len(events)))
+    return np.unique(np.concatenate([shape, events]))
+
+def serialize_telemetry(car_data, idx):
+    """Puntos de telemetría a partir de columnas completas (sin iloc fila a fila)."""
+    cols = {
+        "Distance": np.round(car_data['Distance'].to_numpy(dtype=float)[idx], 1).tolist(),
+        "Speed": car_data['Speed'].to_numpy()[idx].astype(int).tolist(),
+        "Throttle": car_data['Throttle'].to_numpy()[idx].astype(int).tolist(),
+        "Brake": car_data['Brake'].to_numpy()[idx].astype(float).tolist(),
+        "RPM": car_data['RPM'].to_numpy()[idx].astype(int).tolist(),
+        "nGear": car_data['nGear'].to_numpy()[idx].astype(int).tolist(),
+    }
+    keys = list(cols)
+    return [dict(zip(keys, row)) for row in zip(*cols.values())]
+
+def build_telemetry_payload(session, driver_code, step=3, points=None):
+    """JSON de la vuelta rápida del piloto a partir de una sesión ya cargada.
+    Con `points` se usa el diezmado adaptativo en lugar de 1 de cada `step` muestras."""
+    # Buscar piloto y vuelta rápida
+    driver_laps = session.laps.pick_driver(driver_code)
+    if driver_laps.empty:
+        return {"error": f"No hay datos para {driver_code}"}
+        
+    fastest_lap = driver_laps.pick_fastest()
+    car_data = fastest_lap.get_car_data().add_distance()
+    
+    # Info del circuito (Curvas)
+    circuit_info = session.get_circuit_info()
+    corners = []
+    if circuit_info is not None:
+        for _, row in circuit_info.corners.iterrows():
+            corners.append({
+                "Number": str(row['Number']),
+                "Distance": float(row['Distance'])
+            })
+
+    # Reducir datos para no saturar el navegador
+    if points: idx = adaptive_indices(car_data, points)
+    else: idx = np.arange(0, len(car_data), step)
+    telemetry_points = serialize_telemetry(car_data, idx)
+
+    lap_time_str = str(fastest_lap['LapTime']).split('days ')[-1]
+
+    return {
+        "driver": driver_code,
+        "lap_time": lap_time_str,
+        "eventName": session.event['EventName'],
+        "telemetry": telemetry_points,
+        "corners": corners
+    }
+
+def _variant(step, points):
+    return f"lttb{int(points)}" if points else f"step{int(step)}"
+
+def get_telemetry_data(driver_code, gp_name, year, step=3, points=None):
+    timer = StageTimer()
+    if points: points = clamp_points(points)
+    variant = _variant(step, points)
+    with timer.stage('cache_read'): cached = RESPONSE_CACHE.get(driver_code, gp_name, year, variant)
+    if cached is not None:
+        cached["timings"] = timer.as_dict()
+        return cached
     try:
         # Cargar sesión de Carrera
-        session = fastf1.get_session(int(year), gp_name, 'R')
-        session.load(laps=True, telemetry=True, weather=False, messages=False)
-        
-        # Buscar piloto y vuelta rápida
-        driver_laps = session.laps.pick_driver(driver_code)
+        with timer.stage('session_load'): session = load_race_session(gp_name, year)
+        with timer.stage('serialization'): result = build_telemetry_payload(session, driver_code, step, points)
+    except Exception as e:
+        return {"error": f"Error FastF1: {str(e)}"}
+    if 'error' not in result:
+        with timer.stage('cache_write'): RESPONSE_CACHE.put(driver_code, gp_name, year, variant, result)
+    result["timings"] = timer.as_dict()
+    return result
+
+COMPARE_CHANNELS = ['Speed', 'Throttle', 'Brake', 'RPM', 'nGear']
+
+def interpolate_batch(xs, ys, grid):
+    """
+    Interpolación lineal de N series sobre una rejilla común con una sola búsqueda.
+    xs: lista de N arrays crecientes; ys: lista de N arrays (canales, muestras).
+    Devuelve un array (N, canales, len(grid)).
+    """
+    n, length = len(xs), max(len(x) for x in xs)
+    # Igualamos longitudes repitiendo el último valor de cada serie
+    X = np.stack([np.pad(x, (0, length - len(x)), mode='edge') for x in xs])
+    Y = np.stack([np.pad(y, ((0, 0), (0, length - y.shape[1])), mode='edge') for y in ys]).transpose(0, 2, 1)
+    # Desplazando cada fila por encima de la anterior, una sola searchsorted sirve para todas
+    span = X.max() - min(X.min(), grid.min()) + 1.0
+    offsets = np.arange(n)[:, None] * span
+    pos = np.searchsorted((X + offsets).ravel(), (grid[None, :] + offsets).ravel(), side='right')
+    hi = np.clip(pos.reshape(n, -1) - np.arange(n)[:, None] * length, 1, length - 1)
+    lo = hi - 1
+    rows = np.arange(n)[:, None]
+    x0, x1 = X[rows, lo], X[rows, hi]
+    w = np.where(x1 > x0, np.clip((grid[None, :] - x0) / np.where(x1 > x0, x1 - x0, 1.0), 0, 1), 0.0)
+    values = Y[rows, lo] * (1 - w[:, :, None]) + Y[rows, hi] * w[:, :, None]
+    return values.transpose(0, 2, 1)
+
+def build_comparison_payload(session, drivers, points=500):
+    """Vueltas rápidas de varios pilotos alineadas por distancia, con delta de tiempo respecto al primero."""
+    laps, xs, ys = [], [], []
+    for driver in drivers:
+        driver_laps = session.laps.pick_driver(driver)
         if driver_laps.empty:
-            return {"error": f"No hay datos para {driver_code}"}
-            
-        fastest_lap = driver_laps.pick_fastest()
-        car_data = fastest_lap.get_car_data().add_distance()
-        
-        # Info del circuito (Curvas)
-        circuit_info = session.get_circuit_info()
-        corners = []
-        if circuit_info is not None:
-            for _, row in circuit_info.corners.iterrows():
-                corners.append({
-                    "Number": str(row['Number']),
-                    "Distance": float(row['Distance'])
-                })
-
-        # Reducir datos (1 de cada 3 puntos) para no saturar el navegador
-        telemetry_points = []
-        step = 3
-        for i in range(0, len(car_data), step):
-            point = car_data.iloc[i]
-            telemetry_points.append({
-                "Distance": round(float(point['Distance']), 1),
-                "Speed": int(point['Speed']),
-                "Throttle": int(point['Throttle']),
-                "Brake": float(point['Brake']),
-                "RPM": int(point['RPM']),
-                "nGear": int(point['nGear'])
-            })
+            return {"error": f"No hay datos para {driver}"}
+        lap = driver_laps.pick_fastest()
+        car_data = lap.get_car_data().add_distance()
+        laps.append(lap)
+        xs.append(car_data['Distance'].to_numpy(dtype=float))
+        ys.append(np.vstack([car_data['Time'].dt.total_seconds().to_numpy(dtype=float)] +
+                            [car_data[c].to_numpy(dtype=float) for c in COMPARE_CHANNELS]))
+
+    # Rejilla común hasta la distancia que cubren todos los pilotos
+    grid = np.linspace(0.0, min(x[-1] for x in xs), clamp_points(points))
+    values = interpolate_batch(xs, ys, grid)
+    delta = values[:, 0, :] - values[0, 0, :]
 
-        lap_time_str = str(fastest_lap['LapTime']).split('days ')[-1]
+    circuit_info = session.get_circuit_info()
+    corners = []
+    if circuit_info is not None:
+        corners = [{"Number": str(n), "Distance": float(d)}
+                   for n, d in zip(circuit_info.corners['Number'], circuit_info.corners['Distance'])]
 
-        return {
-            "driver": driver_code,
-            "lap_time": lap_time_str,
-            "eventName": session.event['EventName'],
-            "telemetry": telemetry_points,
-            "corners": corners
-        }
+    result = {
+        "eventName": session.event['EventName'],
+        "reference": drivers[0],
+        "distance": np.round(grid, 1).tolist(),
+        "corners": corners,
+        "drivers": []
+    }
+    for i, (driver, lap) in enumerate(zip(drivers, laps)):
+        entry = {"driver": driver, "lap_time": str(lap['LapTime']).split('days ')[-1],
+                 "delta": np.round(delta[i], 3).tolist()}
+        for c, channel in enumerate(COMPARE_CHANNELS, start=1):
+            entry[channel] = np.round(values[i, c], 1).tolist()
+        result["drivers"].append(entry)
+    return result
 
+def get_comparison_data(drivers, gp_name, year, points=500):
+    """Comparativa de N pilotos con una sola carga de sesión."""
+    if not drivers:
+        return {"error": "Faltan pilotos"}
+    timer = StageTimer()
+    try:
+        key, variant = '-'.join(drivers), f"cmp{clamp_points(points)}"
+    except (TypeError, ValueError) as e:
+        return {"error": f"Parámetros no válidos: {e}"}
+    with timer.stage('cache_read'): cached = RESPONSE_CACHE.get(key, gp_name, year, variant)
+    if cached is not None:
+        cached["timings"] = timer.as_dict()
+        return cached
+    try:
+        with timer.stage('session_load'): session = load_race_session(gp_name, year)
+        with timer.stage('serialization'): result = build_comparison_payload(session, drivers, points)
     except Exception as e:
         return {"error": f"Error FastF1: {str(e)}"}
+    if 'error' not in result:
+        with timer.stage('cache_write'): RESPONSE_CACHE.put(key, gp_name, year, variant, result)
+    result["timings"] = timer.as_dict()
+    return result
+
+def prewarm_season(year, step=3, points=None):
+    """Rellena la caché de respuestas con todos los pilotos de todas las carreras de la temporada."""
+    schedule = fastf1.get_event_schedule(int(year), include_testing=False)
+    events = schedule[schedule['EventDate'] < pd.Timestamp.now()]
+    if points: points = clamp_points(points)
+    variant = _variant(step, points)
+    for gp_name in events['EventName']:
+        try:
+            session = fastf1.get_session(int(year), gp_name, 'R')
+            session.load(laps=True, telemetry=True, weather=False, messages=False)
+        except Exception as e:
+            print(f"⚠️  {year} {gp_name}: {e}", file=sys.stderr)
+            continue
+        drivers = session.laps['Driver'].unique()
+        for driver in drivers:
+            if RESPONSE_CACHE.get(driver, gp_name, year, variant) is not None: continue
+            try: result = build_telemetry_payload(session, driver, step, points)
+            except Exception as e: continue
+            if 'error' not in result:
+                RESPONSE_CACHE.put(driver, gp_name, year, variant, result)
+        print(f"✅ {year} {gp_name}: {len(drivers)} pilotos", file=sys.stderr)
 
 if __name__ == "__main__":
+    # Pre-calentado de caché: python f1_telemetry_helper.py --prewarm 2024 [puntos]
+    if len(sys.argv) >= 3 and sys.argv[1] == '--prewarm':
+        prewarm_season(sys.argv[2], points=int(sys.argv[3]) if len(sys.argv) >= 4 else None)
     # Argumentos desde Node.js
-    if len(sys.argv) >= 4:
+    elif len(sys.argv) >= 4:
         driver, gp, year = sys.argv[1], sys.argv[2], sys.argv[3]
         result = get_telemetry_data(driver, gp, year)
         print(json.dumps(result))
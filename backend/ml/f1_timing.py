@@ -0,0 +1,168 @@
+import os
+import sys
+import json
+import time
+import logging
+import tracemalloc
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
+# ==========================================
+# ⏱️ TIEMPOS POR ETAPA Y PERFILADO
+# ==========================================
+# StageTimer mide etapas (contexto, carga de modelo, búsqueda...) con tiempos
+# exclusivos: una etapa anidada no se cuenta dos veces, y la suma de etapas
+# es el total. Los tiempos viajan en el campo `timings` de la respuesta y se
+# guardan en logs/timings.log (JSON por línea, con rotación).
+# Perfilado opcional por petición: RACESCOPE_PROFILE=cprofile|pyinstrument
+# (todas las peticiones) o "profile" en la petición al worker.
+# MemoryMeter mide la memoria de cada petición (RSS y crecimiento del pico del
+# proceso); con RACESCOPE_TRACE_MEMORY=1 también el pico exacto de tracemalloc.
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(SCRIPT_DIR)
+LOGS_DIR = os.path.join(BACKEND_DIR, 'logs')
+PROFILES_DIR = os.path.join(LOGS_DIR, 'profiles')
+
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUPS = 5
+PROFILE_MODE = os.environ.get('RACESCOPE_PROFILE', '').lower()
+TRACE_MEMORY = os.environ.get('RACESCOPE_TRACE_MEMORY') == '1'  # Más preciso pero ralentiza las asignaciones
+
+@contextmanager
+def _file_lock(path):
+    """Cerrojo exclusivo entre procesos (flock). En Windows no hay fcntl: sin cerrojo."""
+    try: import fcntl
+    except ImportError:
+        yield
+        return
+    # Se abre en cada uso: un descriptor heredado tras fork compartiría el cerrojo con el padre
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try: yield
+        finally: fcntl.flock(f, fcntl.LOCK_UN)
+
+class SharedRotatingFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler para un fichero que escriben varios procesos a la vez (workers del
+    pool de Node, procesos de entrenamiento): cada escritura va bajo un cerrojo de fichero
+    y, si otro proceso ya ha rotado, se reabre el fichero nuevo antes de escribir.
+    """
+    def __init__(self, filename, **kwargs):
+        super().__init__(filename, delay=True, **kwargs)
+        self.lock_path = f"{self.baseFilename}.lock"
+
+    def emit(self, record):
+        with _file_lock(self.lock_path):
+            if self.stream is not None:
+                try: rotated = os.fstat(self.stream.fileno()).st_ino != os.stat(self.baseFilename).st_ino
+                except OSError: rotated = True
+                if rotated:
+                    self.stream.close()
+                    self.stream = None
+            super().emit(record)
+
+def rotating_logger(name, filename, level=logging.DEBUG, fmt='%(asctime)s - %(levelname)s - %(message)s'):
+    """Logger con fichero rotativo en backend/logs (se añade a lo anterior, no lo sobrescribe)."""
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
+    if not logger.handlers:
+        os.makedirs(LOGS_DIR, exist_ok=True)
+        fh = SharedRotatingFileHandler(os.path.join(LOGS_DIR, filename), maxBytes=LOG_MAX_BYTES,
+                                       backupCount=LOG_BACKUPS, encoding='utf-8')
+        fh.setFormatter(logging.Formatter(fmt))
+        logger.addHandler(fh)
+        logger.propagate = False
+    return logger
+
+class StageTimer:
+    def __init__(self):
+        self.stages = {}
+        self._stack = []
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        t0 = time.perf_counter()
+        self._stack.append(0.0)  # Tiempo consumido por etapas hijas
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t0
+            children = self._stack.pop()
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed - children
+            if self._stack: self._stack[-1] += elapsed
+
+    def as_dict(self):
+        """Milisegundos por etapa, más el total desde la creación del temporizador."""
+        timings = {k: round(v * 1000, 2) for k, v in self.stages.items()}
+        timings['total'] = round((time.perf_counter() - self._start) * 1000, 2)
+        return timings
+
+def _rss_mb():
+    """(RSS actual, pico de RSS del proceso) en MB; None donde no se puede leer (Windows)."""
+    current = peak = None
+    try:
+        with open('/proc/self/statm') as f: current = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except Exception: pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak = peak / 2**20 if sys.platform == 'darwin' else peak / 2**10  # bytes en macOS, KB en Linux
+    except Exception: pass
+    return current, peak
+
+class MemoryMeter:
+    """
+    Memoria de una petición. peak_growth_mb es lo que la petición ha subido el pico
+    histórico del proceso (0 si cabe en memoria ya usada); traced_peak_mb, el pico real
+    de asignaciones de Python/NumPy durante la petición (solo con TRACE_MEMORY).
+    """
+    def __init__(self, trace=TRACE_MEMORY):
+        self.trace = trace
+        self._start_rss, self._start_peak = _rss_mb()
+        if self.trace:
+            if not tracemalloc.is_tracing(): tracemalloc.start()
+            tracemalloc.reset_peak()
+
+    def as_dict(self):
+        rss, peak = _rss_mb()
+        memory = {}
+        if rss is not None: memory['rss_mb'] = round(rss, 1)
+        if peak is not None:
+            memory['max_rss_mb'] = round(peak, 1)
+            if self._start_peak is not None: memory['peak_growth_mb'] = round(peak - self._start_peak, 1)
+        if self.trace: memory['traced_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+        return memory
+
+_TIMINGS_LOG = None
+
+def log_timings(action, params, timings, memory=None):
+    global _TIMINGS_LOG
+    if _TIMINGS_LOG is None:
+        _TIMINGS_LOG = rotating_logger('RaceScope_Timings', 'timings.log', level=logging.INFO, fmt='%(message)s')
+    try:
+        _TIMINGS_LOG.info(json.dumps({'ts': time.strftime('%Y-%m-%dT%H:%M:%S'), 'action': action,
+                                      'params': params, 'timings': timings, 'memory': memory}, default=str))
+    except Exception: pass
+
+def run_profiled(fn, mode, label):
+    """Ejecuta fn() bajo cProfile o pyinstrument y guarda el informe en logs/profiles/."""
+    os.makedirs(PROFILES_DIR, exist_ok=True)
+    base = os.path.join(PROFILES_DIR, f"{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}_{label}")
+    if mode == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("[PY DEBUG] pyinstrument no está instalado, usando cProfile", file=sys.stderr)
+        else:
+            profiler = Profiler()
+            profiler.start()
+            try: return fn(), f"{base}.html"
+            finally:
+                profiler.stop()
+                with open(f"{base}.html", 'w', encoding='utf-8') as f: f.write(profiler.output_html())
+
+    import cProfile
+    profiler = cProfile.Profile()
+    try: return profiler.runcall(fn), f"{base}.prof"
+    finally: profiler.dump_stats(f"{base}.prof")
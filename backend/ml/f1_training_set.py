@@ -0,0 +1,172 @@
+import os
+import sys
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from f1_lap_store import LapStore, LAPS_DIR
+from f1_files import atomic_write
+
+# ==========================================
+# 🧮 CONJUNTO DE ENTRENAMIENTO (preparado una vez, en caché)
+# ==========================================
+# data/features/ guarda la matriz de todos los pilotos ya preparada: filas
+# ordenadas por piloto (cada piloto es un bloque contiguo), X en float32 con
+# los códigos de compuesto/circuito propios de cada piloto (mismos que daría su
+# LabelEncoder), tiempos, pesos por stint y las clases de los encoders.
+# También guarda los códigos globales de compuesto/circuito para el modelo
+# común a todos los pilotos (global_matrix), que usa incluso a los debutantes.
+# La huella de las particiones del almacén decide si hay que rehacerla: los
+# re-entrenamientos y experimentos con hiperparámetros la leen con mmap.
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(SCRIPT_DIR)
+FEATURES_DIR = os.path.join(BACKEND_DIR, 'data', 'features')
+
+FEATURES = ['TyreLife', 'RaceLapNumber', 'Compound_Enc', 'Circuit_Enc',
+            'TrackTemp', 'AirTemp', 'IsFreshTyre', 'TopSpeed']
+SOURCE_COLUMNS = ['LapTimeSec', 'RaceLapNumber', 'TyreLife', 'Compound', 'Stint', 'Driver', 'Year', 'Circuit',
+                  'SessionType', 'TrackTemp', 'AirTemp', 'IsFreshTyre', 'TopSpeed']
+GLOBAL_FEATURES = FEATURES + ['Driver_Enc']
+ARRAYS = ['X', 'y', 'weight', 'circuit', 'compound', 'is_race']
+MIN_DRIVER_LAPS = 50   # Mínimo para un modelo propio; el global usa todas las vueltas
+PREP_VERSION = 2   # Subir si cambia la preparación: invalida las cachés existentes
+
+# Extrapolación del HARD para pilotos sin vueltas con él (a partir del MEDIUM)
+SYNTH_HARD_OFFSET = 0.8
+SYNTH_HARD_LIFE = 0.8
+
+def store_fingerprint(store):
+    """Huella de las particiones del almacén (ruta, tamaño y mtime) y de la versión de preparación."""
+    h = hashlib.sha1(f"v{PREP_VERSION}".encode())
+    for path in store.partitions():
+        st = os.stat(path)
+        h.update(f"{os.path.relpath(path, store.root)}|{st.st_size}|{st.st_mtime_ns}".encode())
+    return h.hexdigest()[:16]
+
+def _local_codes(driver_idx, global_codes, n_classes):
+    """
+    Códigos por piloto a partir de los globales (ordenados): el rango de cada clase
+    entre las que usa ese piloto, igual que un LabelEncoder ajustado solo con sus datos.
+    """
+    pairs = driver_idx.astype(np.int64) * n_classes + global_codes
+    uniq, inverse = np.unique(pairs, return_inverse=True)
+    first = np.searchsorted(uniq, np.arange(driver_idx.max() + 1, dtype=np.int64) * n_classes)
+    return inverse.ravel() - first[driver_idx], uniq
+
+def build_training_set(store):
+    """Prepara todas las vueltas del almacén de una vez. Devuelve (arrays, meta)."""
+    df = store.read(columns=SOURCE_COLUMNS)
+    for col in ['Compound', 'Circuit', 'SessionType', 'Driver']: df[col] = df[col].astype(str)
+    df = df.dropna(subset=['LapTimeSec', 'TyreLife'])
+    real_laps = df['Driver'].value_counts()
+    if df.empty:
+        return ({'X': np.zeros((0, len(FEATURES)), dtype=np.float32), 'y': np.zeros(0, dtype=np.float32),
+                 'weight': np.zeros(0, dtype=np.float32), 'circuit': np.zeros(0, dtype=np.int32),
+                 'compound': np.zeros(0, dtype=np.int32), 'is_race': np.zeros(0, dtype=bool)},
+                {'version': PREP_VERSION, 'features': FEATURES, 'circuits': [], 'compounds': [], 'drivers': {}})
+
+    # Extrapolación Hard (en bloque para todos los pilotos sin HARD)
+    with_hard = df.loc[df['Compound'] == 'HARD', 'Driver'].unique()
+    syn = df[(df['Compound'] == 'MEDIUM') & ~df['Driver'].isin(with_hard)].copy()
+    syn['Compound'] = 'HARD'
+    syn['LapTimeSec'] += SYNTH_HARD_OFFSET
+    syn['TyreLife'] = syn['TyreLife'] * SYNTH_HARD_LIFE
+    # Orden estable por piloto: sus vueltas reales y detrás las sintéticas
+    df = pd.concat([df, syn], ignore_index=True).sort_values('Driver', kind='stable', ignore_index=True)
+
+    # Pesos: vueltas del stint (los stints cortos cuentan poco)
+    stint_len = df.groupby(['Driver', 'Year', 'Circuit', 'SessionType', 'Stint'])['RaceLapNumber'].transform('count')
+    weight = np.where(stint_len > 3, stint_len, 0.5)
+    top_speed = df['TopSpeed'].fillna(df.groupby('Driver')['TopSpeed'].transform('mean'))
+
+    drivers, driver_idx = np.unique(df['Driver'].to_numpy(), return_inverse=True)
+    circuits, circuit_idx = np.unique(df['Circuit'].to_numpy(), return_inverse=True)
+    compounds, compound_idx = np.unique(df['Compound'].to_numpy(), return_inverse=True)
+    circuit_enc, circuit_pairs = _local_codes(driver_idx, circuit_idx, len(circuits))
+    compound_enc, compound_pairs = _local_codes(driver_idx, compound_idx, len(compounds))
+
+    X = np.column_stack([df['TyreLife'], df['RaceLapNumber'], compound_enc, circuit_enc,
+                         df['TrackTemp'], df['AirTemp'], df['IsFreshTyre'], top_speed]).astype(np.float32)
+    arrays = {
+        'X': X,
+        'y': df['LapTimeSec'].to_numpy(np.float32),
+        'weight': weight.astype(np.float32),
+        'circuit': circuit_idx.astype(np.int32),
+        'compound': compound_idx.astype(np.int32),
+        'is_race': (df['SessionType'] == 'R').to_numpy(),
+    }
+    bounds = np.searchsorted(driver_idx, np.arange(len(drivers) + 1))
+    meta = {'version': PREP_VERSION, 'features': FEATURES, 'circuits': circuits.tolist(),
+            'compounds': compounds.tolist(), 'drivers': {}}
+    for i, driver in enumerate(drivers):
+        meta['drivers'][str(driver)] = {
+            'rows': [int(bounds[i]), int(bounds[i + 1])], 'laps': int(real_laps[driver]),
+            'circuit_classes': circuits[circuit_pairs[circuit_pairs // len(circuits) == i] % len(circuits)].tolist(),
+            'compound_classes': compounds[compound_pairs[compound_pairs // len(compounds) == i] % len(compounds)].tolist(),
+        }
+    return arrays, meta
+
+def save_training_set(arrays, meta, root=FEATURES_DIR):
+    os.makedirs(root, exist_ok=True)
+    for name, arr in arrays.items():
+        atomic_write(os.path.join(root, f"{name}.npy"), lambda f: np.save(f, arr))
+    # La caché solo es válida con meta.json (lleva la huella): va el último
+    atomic_write(os.path.join(root, 'meta.json'), lambda f: json.dump(meta, f, indent=4), mode='w')
+
+class TrainingSet:
+    """Conjunto preparado en disco; los bloques de cada piloto se leen con mmap."""
+    def __init__(self, root=FEATURES_DIR, mmap_mode='r'):
+        self.root = root
+        self.meta = json.load(open(os.path.join(root, 'meta.json'), 'r'))
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(root, f"{name}.npy"), mmap_mode=mmap_mode))
+
+    def drivers(self, min_laps=MIN_DRIVER_LAPS):
+        return sorted(d for d, e in self.meta['drivers'].items() if e['laps'] >= min_laps)
+
+    def driver(self, code, min_laps=MIN_DRIVER_LAPS):
+        """Bloque de un piloto: X, y, pesos, clases de sus encoders y las columnas para las tablas de vueltas."""
+        entry = self.meta['drivers'].get(str(code))
+        if entry is None or entry['laps'] < min_laps: return None
+        start, stop = entry['rows']
+        X = np.asarray(self.X[start:stop])
+        laps = pd.DataFrame({
+            'Circuit': np.array(self.meta['circuits'])[self.circuit[start:stop]],
+            'SessionType': np.where(self.is_race[start:stop], 'R', 'P'),
+            'RaceLapNumber': X[:, FEATURES.index('RaceLapNumber')],
+            'TrackTemp': X[:, FEATURES.index('TrackTemp')],
+            'AirTemp': X[:, FEATURES.index('AirTemp')],
+        })
+        return {'X': X, 'y': np.asarray(self.y[start:stop]), 'weight': np.asarray(self.weight[start:stop]),
+                'circuit_classes': entry['circuit_classes'], 'compound_classes': entry['compound_classes'],
+                'laps': laps}
+
+    def global_matrix(self):
+        """Todas las vueltas con códigos globales de compuesto/circuito y el piloto como columna extra."""
+        names = sorted(self.meta['drivers'], key=lambda d: self.meta['drivers'][d]['rows'][0])
+        sizes = [self.meta['drivers'][d]['rows'][1] - self.meta['drivers'][d]['rows'][0] for d in names]
+        X = np.empty((len(self.y), len(GLOBAL_FEATURES)), dtype=np.float32)
+        X[:, :len(FEATURES)] = self.X
+        X[:, FEATURES.index('Compound_Enc')] = self.compound
+        X[:, FEATURES.index('Circuit_Enc')] = self.circuit
+        X[:, -1] = np.repeat(np.arange(len(names)), sizes)
+        return {'X': X, 'y': np.asarray(self.y), 'weight': np.asarray(self.weight), 'driver_classes': names,
+                'circuit_classes': self.meta['circuits'], 'compound_classes': self.meta['compounds']}
+
+def load_training_set(store=None, root=FEATURES_DIR, rebuild=False):
+    """Abre la caché si sigue al día con el almacén; si no, la prepara y la guarda."""
+    store = store if store is not None else LapStore(LAPS_DIR)
+    fingerprint = store_fingerprint(store)
+    try:
+        meta = json.load(open(os.path.join(root, 'meta.json'), 'r'))
+        if not rebuild and meta.get('fingerprint') == fingerprint: return TrainingSet(root)
+    except (OSError, ValueError): pass
+    arrays, meta = build_training_set(store)
+    meta['fingerprint'] = fingerprint
+    save_training_set(arrays, meta, root)
+    return TrainingSet(root)
+
+if __name__ == "__main__":
+    # python f1_training_set.py [--rebuild]: prepara (si hace falta) y resume la caché
+    ts = load_training_set(rebuild='--rebuild' in sys.argv[1:])
+    print(f"🧮 {len(ts.y)} filas, {len(ts.drivers())} pilotos, {len(ts.meta['circuits'])} circuitos -> {ts.root}")
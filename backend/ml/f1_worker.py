@@ -0,0 +1,103 @@
+import sys
+import json
+import time
+import traceback
+
+# ==========================================
+# 🔁 WORKER PERSISTENTE (JSON-lines por stdin/stdout)
+# ==========================================
+# server.js arranca varios procesos de este script (ver python_pool.js) y les
+# envía una petición JSON por línea:
+#   {"id": 7, "action": "strategy", "driver": "ALO", "gp": "Bahrain Grand Prix", "year": 2024}
+# ("robust": true añade el ranking Monte Carlo, con "scenarios" opcional)
+# y el worker responde con una línea:
+#   {"id": 7, "ok": true, "result": {...}}
+# Con "stream": true, antes de la respuesta final llegan eventos parciales:
+#   {"id": 7, "event": "strategies", "data": {...}}
+# Las importaciones pesadas (fastf1, pandas, sklearn) y los modelos/sesiones
+# cargados se mantienen vivos entre peticiones.
+# Con "profile": "cprofile" | "pyinstrument" en la petición (o RACESCOPE_PROFILE)
+# la petición se perfila y la respuesta indica dónde quedó el informe.
+# Cada respuesta lleva `memory` (MB) de la petición, también en logs/timings.log.
+
+# Reservamos el stdout real para el protocolo: cualquier print de librerías va a stderr
+PROTOCOL_OUT = sys.stdout
+sys.stdout = sys.stderr
+
+from f1_strategy_predictor import MC_SCENARIOS, RaceContextManager, build_strategy_response
+from f1_telemetry_helper import get_telemetry_data, get_comparison_data
+from f1_timing import PROFILE_MODE, MemoryMeter, log_timings, run_profiled
+
+class StrategyWorker:
+    def __init__(self):
+        self.mgr = RaceContextManager()
+        self.handlers = {
+            'ping': self.ping,
+            'strategy': self.strategy,
+            'telemetry': self.telemetry,
+            'compare': self.compare,
+        }
+
+    def ping(self, req):
+        return {'pong': True}
+
+    def strategy(self, req):
+        on_event = None
+        if req.get('stream'):
+            on_event = lambda kind, data: self.emit({'id': req.get('id'), 'event': kind, 'data': data})
+        return build_strategy_response(req['driver'], req['gp'], str(req['year']), mgr=self.mgr,
+                                       robust=bool(req.get('robust')), scenarios=req.get('scenarios') or MC_SCENARIOS,
+                                       on_event=on_event)
+
+    def telemetry(self, req):
+        return get_telemetry_data(req['driver'], req['gp'], req['year'],
+                                  step=req.get('step', 3), points=req.get('points'))
+
+    def compare(self, req):
+        return get_comparison_data(req['drivers'], req['gp'], req['year'], points=req.get('points') or 500)
+
+    def handle(self, req):
+        action = req.get('action')
+        if action not in self.handlers:
+            return {'error': f"Acción desconocida: {action}"}
+        mode = req.get('profile') or PROFILE_MODE
+        if not mode or action == 'ping':
+            return self.handlers[action](req)
+        mode = mode if mode in ('cprofile', 'pyinstrument') else 'cprofile'
+        result, path = run_profiled(lambda: self.handlers[action](req), mode, action)
+        if isinstance(result, dict): result['profile'] = path
+        return result
+
+    def emit(self, payload):
+        line = json.dumps(payload)
+        PROTOCOL_OUT.write(line + '\n')
+        PROTOCOL_OUT.flush()
+        return line
+
+    def log(self, req, result, serialize_ms):
+        timings = result.get('timings') if isinstance(result, dict) else None
+        if timings is None: return
+        params = {k: v for k, v in req.items() if k not in ('id', 'action', 'profile', 'stream')}
+        log_timings(req.get('action'), params, {**timings, 'serialize': round(serialize_ms, 2)}, result.get('memory'))
+
+    def serve(self, stream):
+        self.emit({'event': 'ready'})
+        for line in stream:
+            line = line.strip()
+            if not line: continue
+            req_id = None
+            try:
+                req = json.loads(line)
+                req_id = req.get('id')
+                meter = MemoryMeter()
+                result = self.handle(req)
+                if isinstance(result, dict) and 'error' not in result: result['memory'] = meter.as_dict()
+                t0 = time.perf_counter()
+                self.emit({'id': req_id, 'ok': 'error' not in result, 'result': result})
+                self.log(req, result, (time.perf_counter() - t0) * 1000)
+            except Exception as e:
+                print(f"[PY DEBUG] Error en worker: {traceback.format_exc()}", file=sys.stderr)
+                self.emit({'id': req_id, 'ok': False, 'result': {'error': str(e)}})
+
+if __name__ == "__main__":
+    StrategyWorker().serve(sys.stdin)
@@ -0,0 +1,140 @@
+const { spawn } = require('child_process');
+const path = require('path');
+const fs = require('fs');
+const os = require('os');
+const readline = require('readline');
+
+// Detecta el Python del entorno virtual (venv) de la raíz del proyecto
+function resolvePython() {
+    const venvPathLinux = path.join(__dirname, '..', 'venv', 'bin', 'python');
+    const venvPathWin = path.join(__dirname, '..', 'venv', 'Scripts', 'python.exe');
+    if (fs.existsSync(venvPathLinux)) return venvPathLinux;
+    if (fs.existsSync(venvPathWin)) return venvPathWin;
+    return 'python3'; // Fallback global
+}
+
+// --- POOL DE WORKERS PYTHON PERSISTENTES (ml/f1_worker.py) ---
+// Cada worker es un proceso que mantiene fastf1/sklearn importados y los
+// modelos/sesiones cargados. Las peticiones se reparten entre workers libres
+// y, si todos están ocupados, esperan en cola.
+// Un worker que muere se reinicia con espera creciente (1s, 2s, 4s... hasta
+// 30s); tras MAX_RESPAWNS fallos seguidos sin llegar a 'ready' se da por
+// perdido y, si no queda ninguno, las peticiones en cola se rechazan.
+const RESPAWN_BASE_MS = 1000;
+const RESPAWN_MAX_MS = 30000;
+const MAX_RESPAWNS = 5;
+
+class PythonWorkerPool {
+    constructor({ size, timeoutMs } = {}) {
+        this.size = size || Math.max(1, Math.min(4, os.cpus().length));
+        this.timeoutMs = timeoutMs || 120000;
+        this.pythonCmd = resolvePython();
+        this.scriptPath = path.join(__dirname, 'ml', 'f1_worker.py');
+        this.workers = [];
+        this.queue = [];
+        this.nextId = 1;
+        this.failures = new Array(this.size).fill(0);
+        for (let i = 0; i < this.size; i++) this.workers.push(this._spawn(i));
+    }
+
+    _spawn(index) {
+        const proc = spawn(this.pythonCmd, [this.scriptPath], { cwd: path.dirname(this.scriptPath) });
+        const worker = { index, proc, busy: false, ready: false, dead: false, current: null };
+
+        readline.createInterface({ input: proc.stdout }).on('line', (line) => this._onLine(worker, line));
+        proc.stdin.on('error', () => {});  // EPIPE si muere a mitad de escritura: lo gestiona 'exit'
+        proc.stderr.on('data', (data) => process.stderr.write(`[py#${index}] ${data}`));
+        // 'error': no se pudo lanzar (pythonCmd inexistente...) o matar el proceso
+        proc.on('error', (err) => this._onDeath(worker, `error: ${err.message}`));
+        proc.on('exit', (code) => this._onDeath(worker, `código ${code}`));
+        return worker;
+    }
+
+    _onDeath(worker, reason) {
+        if (worker.dead) return;  // 'error' y 'exit' pueden llegar los dos
+        worker.dead = true;
+        worker.ready = false;
+        if (worker.current) this._finish(worker, { ok: false, result: { error: 'El worker Python se detuvo' } });
+
+        const failures = ++this.failures[worker.index];
+        if (failures > MAX_RESPAWNS) {
+            console.error(`❌ Worker Python #${worker.index} terminó (${reason}) tras ${MAX_RESPAWNS} reinicios, se abandona`);
+            this._rejectIfNoWorkers();
+            return;
+        }
+        const delay = Math.min(RESPAWN_BASE_MS * 2 ** (failures - 1), RESPAWN_MAX_MS);
+        console.error(`⚠️  Worker Python #${worker.index} terminó (${reason}), reiniciando en ${delay / 1000}s...`);
+        setTimeout(() => { this.workers[worker.index] = this._spawn(worker.index); }, delay);
+    }
+
+    // Sin workers vivos ni reinicios pendientes: nadie atenderá la cola
+    _exhausted() {
+        return this.failures.every((f) => f > MAX_RESPAWNS);
+    }
+
+    _rejectIfNoWorkers() {
+        if (!this._exhausted()) return;
+        const error = new Error('No hay workers Python disponibles');
+        while (this.queue.length) this.queue.shift().reject(error);
+    }
+
+    _onLine(worker, line) {
+        let msg;
+        try {
+            msg = JSON.parse(line);
+        } catch (e) {
+            console.log(`[py#${worker.index}] ${line}`);
+            return;
+        }
+        if (msg.event === 'ready') {
+            worker.ready = true;
+            this.failures[worker.index] = 0;
+            this._dispatch();
+            return;
+        }
+        if (!worker.current || msg.id !== worker.current.id) return;
+        // Evento parcial (peticiones con stream): la respuesta final llega después
+        if (msg.event) {
+            if (worker.current.onEvent) worker.current.onEvent(msg.event, msg.data);
+            return;
+        }
+        this._finish(worker, msg);
+    }
+
+    _finish(worker, msg) {
+        const job = worker.current;
+        clearTimeout(job.timer);
+        worker.current = null;
+        worker.busy = false;
+        if (msg.ok) job.resolve(msg.result);
+        else job.reject(Object.assign(new Error(msg.result?.error || 'Error Python'), { result: msg.result }));
+        this._dispatch();
+    }
+
+    _dispatch() {
+        while (this.queue.length) {
+            const worker = this.workers.find((w) => w.ready && !w.busy);
+            if (!worker) return;
+            const job = this.queue.shift();
+            worker.busy = true;
+            worker.current = job;
+            job.timer = setTimeout(() => {
+                console.error(`⏱️  Timeout en worker Python #${worker.index}, matando proceso`);
+                worker.proc.kill();
+            }, this.timeoutMs);
+            worker.proc.stdin.write(JSON.stringify({ id: job.id, action: job.action, ...job.params }) + '\n');
+        }
+    }
+
+    // Devuelve una promesa con el resultado de la acción ('strategy', 'telemetry', ...)
+    // onEvent(evento, datos) recibe los resultados parciales si la acción los emite
+    run(action, params, onEvent) {
+        return new Promise((resolve, reject) => {
+            if (this._exhausted()) return reject(new Error('No hay workers Python disponibles'));
+            this.queue.push({ id: this.nextId++, action, params, onEvent, resolve, reject });
+            this._dispatch();
+        });
+    }
+}
+
+module.exports = { PythonWorkerPool, resolvePython };
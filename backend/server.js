@@ -1,8 +1,8 @@
 const express = require('express');
 const cors = require('cors');
-const { spawn } = require('child_process');
 const path = require('path');
 const fs = require('fs');
+const { PythonWorkerPool } = require('./python_pool');
 
 const app = express();
 const PORT = 5001;
@@ -19,9 +19,33 @@ if (!fs.existsSync(strategiesDir)) {
 }
 app.use('/strategies', express.static(strategiesDir));
 
+// --- POOL DE WORKERS PYTHON ---
+// En lugar de lanzar un intérprete por petición, mantenemos procesos vivos
+// (ml/f1_worker.py) con los modelos y sesiones ya cargados.
+const pool = new PythonWorkerPool({ size: parseInt(process.env.PY_WORKERS, 10) || undefined });
+console.log(`🐍 Usando Python en: ${pool.pythonCmd} (${pool.size} workers)`);
+
+// Perfilado por petición ({"profile": "cprofile" | "pyinstrument"}), solo si se habilita
+// explícitamente: los informes se escriben en backend/logs/profiles
+function profileParam(req) {
+    return process.env.RACESCOPE_ALLOW_PROFILE === '1' ? req.body.profile : undefined;
+}
+
+// Presupuesto de muestras de telemetría: se recorta a un rango fijo para que una
+// petición no pueda pedir arrays enormes a un worker (el helper Python recorta igual)
+const MIN_POINTS = 50;
+const MAX_POINTS = 5000;
+const MAX_COMPARE_DRIVERS = 20;  // La rejilla de comparación crece con pilotos x canales x puntos
+const DRIVER_CODE = /^[A-Za-z0-9]{1,4}$/;
+function pointsParam(points) {
+    const n = parseInt(points, 10);
+    return n ? Math.min(Math.max(n, MIN_POINTS), MAX_POINTS) : null;
+}
+
 // --- ENDPOINT: PREDICCIÓN DE ESTRATEGIA (ML) ---
-app.post('/api/predict-strategy', (req, res) => {
-    const { driver, gp, year } = req.body;
+app.post('/api/predict-strategy', async (req, res) => {
+    // robust (opcional): añade el ranking Monte Carlo; scenarios = nº de escenarios
+    const { driver, gp, year, robust, scenarios } = req.body;
 
     if (!driver || !gp || !year) {
         return res.status(400).json({ error: "Faltan datos: driver, gp, year" });
@@ -29,68 +53,64 @@ app.post('/api/predict-strategy', (req, res) => {
 
     console.log(`🏁 Solicitando estrategia ML: ${driver} @ ${gp} ${year}`);
 
-    // Ruta absoluta al script Python
-    const scriptPath = path.join(__dirname, 'ml', 'f1_strategy_predictor.py');
-    
-    // --- CAMBIO AQUÍ: Detectar el Python del entorno virtual (venv) ---
-    // Buscamos el ejecutable de Python en la carpeta venv de la raíz del proyecto
-    let pythonCmd = 'python3'; // Fallback global
-    
-    // Ruta relativa desde backend/ hacia arriba: ../venv/bin/python (Mac/Linux) o ../venv/Scripts/python.exe (Windows)
-    const venvPathLinux = path.join(__dirname, '..', 'venv', 'bin', 'python');
-    const venvPathWin = path.join(__dirname, '..', 'venv', 'Scripts', 'python.exe');
-
-    if (fs.existsSync(venvPathLinux)) {
-        pythonCmd = venvPathLinux;
-    } else if (fs.existsSync(venvPathWin)) {
-        pythonCmd = venvPathWin;
+    try {
+        const result = await pool.run('strategy', {
+            driver, gp, year: year.toString(), robust: robust === true || robust === 'true',
+            scenarios: parseInt(scenarios, 10) || null, profile: profileParam(req)
+        });
+        res.json(result);
+    } catch (e) {
+        console.error("❌ Error Python:", e.message);
+        res.status(500).json(e.result || { error: "Fallo en el cálculo de estrategia", details: e.message });
     }
-    
-    console.log(`🐍 Usando Python en: ${pythonCmd}`);
-    // ------------------------------------------------------------------
-
-    const pyProcess = spawn(pythonCmd, [scriptPath, driver, gp, year.toString()]);
+});
 
-    let dataString = '';
-    let errorString = '';
+// --- ENDPOINT: ESTRATEGIA PROGRESIVA (Server-Sent Events) ---
+// GET /api/predict-strategy/stream?driver=ALO&gp=...&year=2024
+// Eventos: context (circuito, sin estrategias), strategies (cada mejora del top-K),
+// deterministic (modo robusto, antes del Monte Carlo), result (respuesta final) o error.
+// Cada evento lleva la respuesta completa con la misma forma que /api/predict-strategy.
+app.get('/api/predict-strategy/stream', async (req, res) => {
+    const { driver, gp, year, robust, scenarios } = req.query;
 
-    pyProcess.stdout.on('data', (data) => {
-        dataString += data.toString();
-    });
+    if (!driver || !gp || !year) {
+        return res.status(400).json({ error: "Faltan datos: driver, gp, year" });
+    }
 
-    pyProcess.stderr.on('data', (data) => {
-        errorString += data.toString();
-    });
+    console.log(`🏁 Solicitando estrategia ML (stream): ${driver} @ ${gp} ${year}`);
 
-    pyProcess.on('close', (code) => {
-        if (code !== 0) {
-            console.error("❌ Error Python:", errorString);
-            return res.status(500).json({ error: "Fallo en el cálculo de estrategia", details: errorString });
-        }
-
-        try {
-            // Buscamos el último JSON válido en la salida (por si hay logs previos)
-            const lines = dataString.trim().split('\n');
-            const lastLine = lines[lines.length - 1];
-            const result = JSON.parse(lastLine);
-            
-            if (result.error) {
-                return res.status(500).json(result);
-            }
-            
-            res.json(result);
-        } catch (e) {
-            console.error("❌ Error parseando JSON:", e);
-            console.log("Raw Output:", dataString);
-            res.status(500).json({ error: "Respuesta inválida del modelo" });
-        }
+    res.writeHead(200, {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'Connection': 'keep-alive',
+        'X-Accel-Buffering': 'no'
     });
+    res.flushHeaders();
+
+    // Si el cliente se va, el worker termina la búsqueda igualmente (es corta) pero no escribimos más
+    let closed = false;
+    req.on('close', () => { closed = true; });
+    const send = (event, data) => {
+        if (!closed) res.write(`event: ${event}\ndata: ${JSON.stringify(data)}\n\n`);
+    };
+
+    try {
+        const result = await pool.run('strategy', {
+            driver, gp, year: year.toString(), robust: robust === 'true' || robust === '1',
+            scenarios: parseInt(scenarios, 10) || null, stream: true
+        }, send);
+        send('result', result);
+    } catch (e) {
+        console.error("❌ Error Python (stream):", e.message);
+        send('error', e.result || { error: "Fallo en el cálculo de estrategia", details: e.message });
+    }
+    if (!closed) res.end();
 });
 
-
 // --- ENDPOINT: TELEMETRÍA (Python FastF1) ---
-app.post('/api/telemetry', (req, res) => {
-    const { driver, gp, year } = req.body;
+app.post('/api/telemetry', async (req, res) => {
+    // points (opcional): presupuesto de muestras con diezmado adaptativo (LTTB)
+    const { driver, gp, year, points } = req.body;
 
     if (!driver || !gp || !year) {
         return res.status(400).json({ error: "Faltan parámetros" });
@@ -98,37 +118,38 @@ app.post('/api/telemetry', (req, res) => {
 
     console.log(`📡 Solicitando Telemetría: ${driver} @ ${gp} ${year}`);
 
-    const scriptPath = path.join(__dirname, 'ml', 'f1_telemetry_helper.py');
-    
-    // Detección de entorno Python (igual que en predict-strategy)
-    let pythonCmd = 'python3';
-    const venvPathLinux = path.join(__dirname, '..', 'venv', 'bin', 'python');
-    const venvPathWin = path.join(__dirname, '..', 'venv', 'Scripts', 'python.exe');
-    if (fs.existsSync(venvPathLinux)) pythonCmd = venvPathLinux;
-    else if (fs.existsSync(venvPathWin)) pythonCmd = venvPathWin;
-
-    const pyProcess = spawn(pythonCmd, [scriptPath, driver, gp, year.toString()]);
-
-    let dataString = '';
-    let errorString = '';
-
-    pyProcess.stdout.on('data', (data) => dataString += data.toString());
-    pyProcess.stderr.on('data', (data) => errorString += data.toString());
-
-    pyProcess.on('close', (code) => {
-        if (code !== 0) {
-            console.error("Error Python Telemetría:", errorString);
-            return res.status(500).json({ error: "Error obteniendo telemetría", details: errorString });
-        }
-        try {
-            const result = JSON.parse(dataString);
-            if (result.error) return res.status(500).json(result);
-            res.json(result);
-        } catch (e) {
-            console.error("Error JSON:", e);
-            res.status(500).json({ error: "Respuesta inválida" });
-        }
-    });
+    try {
+        const result = await pool.run('telemetry', { driver, gp, year: year.toString(), points: pointsParam(points), profile: profileParam(req) });
+        res.json(result);
+    } catch (e) {
+        console.error("Error Python Telemetría:", e.message);
+        res.status(500).json(e.result || { error: "Error obteniendo telemetría", details: e.message });
+    }
+});
+
+app.post('/api/telemetry/compare', async (req, res) => {
+    // Varios pilotos de la misma sesión, alineados sobre una rejilla de distancia común
+    const { drivers, gp, year, points } = req.body;
+
+    if (!Array.isArray(drivers) || drivers.length === 0 || !gp || !year) {
+        return res.status(400).json({ error: "Faltan parámetros" });
+    }
+    if (!drivers.every((d) => typeof d === 'string' && DRIVER_CODE.test(d))) {
+        return res.status(400).json({ error: "Pilotos no válidos (códigos de 1 a 4 letras/números)" });
+    }
+    if (drivers.length > MAX_COMPARE_DRIVERS) {
+        return res.status(400).json({ error: `Máximo ${MAX_COMPARE_DRIVERS} pilotos por comparación` });
+    }
+
+    console.log(`📡 Comparando Telemetría: ${drivers.join(', ')} @ ${gp} ${year}`);
+
+    try {
+        const result = await pool.run('compare', { drivers, gp, year: year.toString(), points: pointsParam(points), profile: profileParam(req) });
+        res.json(result);
+    } catch (e) {
+        console.error("Error Python Comparación:", e.message);
+        res.status(500).json(e.result || { error: "Error comparando telemetría", details: e.message });
+    }
 });
 
 // Servir mapas de circuitos
@@ -31,8 +31,34 @@ function App() {
     e.preventDefault();
     setLoading(true);
     setError(null);
+    setStrategyData(null);
     setActiveConfig({ driverCode: inputs.driver, gpName: inputs.gp, year: inputs.year });
 
+    // Resultados progresivos (SSE): circuito primero, luego cada mejora de la búsqueda
+    if (window.EventSource) {
+      const params = new URLSearchParams({ driver: inputs.driver, gp: inputs.gp, year: inputs.year });
+      const source = new EventSource(`/api/predict-strategy/stream?${params}`);
+      const update = (e) => setStrategyData(JSON.parse(e.data));
+      ['context', 'strategies', 'deterministic'].forEach(ev => source.addEventListener(ev, update));
+      source.addEventListener('result', (e) => {
+        update(e);
+        source.close();
+        setLoading(false);
+      });
+      source.addEventListener('error', (e) => {
+        source.close();
+        // Sin datos = fallo de conexión: probamos la petición normal
+        if (!e.data) return fetchStrategy();
+        console.error(e.data);
+        setError('Error al conectar con el servidor.');
+        setLoading(false);
+      });
+      return;
+    }
+    fetchStrategy();
+  };
+
+  const fetchStrategy = async () => {
     try {
       /* const res = await axios.post('http://localhost:5001/api/predict-strategy', {*/
       const res = await axios.post('/api/predict-strategy', {
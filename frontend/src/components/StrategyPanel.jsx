@@ -7,24 +7,28 @@ const StrategyPanel = ({ data, loading, error, theme }) => {
   const textColor = theme === 'light' ? '#333' : 'white';
   const subTextColor = theme === 'light' ? '#666' : '#888';
   const statsBg = theme === 'light' ? '#f5f5f5' : '#222';
+  // Con resultados progresivos se pinta la mejor estrategia encontrada hasta ahora
+  const hasStrategies = data && data.strategies && data.strategies.length > 0;
 
   return (
     <>
       <div className="panel-header">
         <h3>OPTIMAL STRATEGY (ML PREDICTION)</h3>
-        {data && <span style={{color:'#00ff00', fontSize:'0.8em', fontWeight:'bold'}}>● LIVE RENDER</span>}
+        {data && (data.partial
+          ? <span style={{color:'#ffaa00', fontSize:'0.8em', fontWeight:'bold'}}>● REFINING...</span>
+          : <span style={{color:'#00ff00', fontSize:'0.8em', fontWeight:'bold'}}>● LIVE RENDER</span>)}
       </div>
 
       <div style={{ flex: 1, padding: '15px', position: 'relative', overflow: 'hidden', display: 'flex', flexDirection: 'column' }}>
         
-        {loading && <div className="loading-overlay">Simulating millions of scenarios...</div>}
+        {loading && !hasStrategies && <div className="loading-overlay">Simulating millions of scenarios...</div>}
         {error && <div style={{color:'red', textAlign:'center', marginTop:20}}>{error}</div>}
         
         {!data && !loading && !error && (
           <div className="loading-overlay">Select parameters and hit START</div>
         )}
 
-        {data && !loading && (
+        {hasStrategies && (
           <div style={{height:'100%', display:'flex', flexDirection:'column', gap:'15px'}}>
             
             {/* Chart Area */}